@@ -0,0 +1,46 @@
+"""added last_activity_at to chat_sessions
+
+Revision ID: 3c8e1f6a2b95
+Revises: 0a6c4e2d8f17
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c8e1f6a2b95'
+down_revision: Union[str, Sequence[str], None] = '0a6c4e2d8f17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat_sessions', sa.Column('last_activity_at', sa.DateTime(), nullable=True))
+
+    # Existing sessions were last active at their newest message, or at creation if they have none
+    conn = op.get_bind()
+    conn.execute(sa.text(
+        "UPDATE chat_sessions SET last_activity_at = coalesce("
+        "(SELECT max(chat_messages.created_at) FROM chat_messages WHERE chat_messages.session_id = chat_sessions.id), "
+        "created_at)"
+    ))
+    # Every row has a value now, so the column can match the model's NOT NULL
+    with op.batch_alter_table('chat_sessions', schema=None) as batch_op:
+        batch_op.alter_column('last_activity_at', existing_type=sa.DateTime(), nullable=False)
+
+    op.drop_index('ix_chat_sessions_user_id_created_at', table_name='chat_sessions')
+    op.create_index('ix_chat_sessions_user_id_last_activity_at_id', 'chat_sessions', ['user_id', 'last_activity_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_chat_sessions_user_id_last_activity_at_id', table_name='chat_sessions')
+    op.create_index('ix_chat_sessions_user_id_created_at', 'chat_sessions', ['user_id', 'created_at'], unique=False)
+    with op.batch_alter_table('chat_sessions', schema=None) as batch_op:
+        batch_op.alter_column('last_activity_at', existing_type=sa.DateTime(), nullable=True)
+    op.drop_column('chat_sessions', 'last_activity_at')
@@ -0,0 +1,62 @@
+"""added unique (user_id, day) key to UsageStats model
+
+Revision ID: 7d1f3b8c9e52
+Revises: c4e8a2f61d07
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d1f3b8c9e52'
+down_revision: Union[str, Sequence[str], None] = 'c4e8a2f61d07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNTER_COLUMNS = (
+    'messages_sent', 'tokens_used', 'prompt_tokens', 'completion_tokens', 'sessions_created', 'web_searches_made'
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('usage_stats', sa.Column('day', sa.Date(), nullable=True))
+
+    conn = op.get_bind()
+    conn.execute(sa.text("UPDATE usage_stats SET day = date(date)"))
+
+    # Racing read-modify-write tracking could leave several rows for one user and day; merge them
+    duplicates = conn.execute(sa.text(
+        "SELECT user_id, day FROM usage_stats GROUP BY user_id, day HAVING COUNT(*) > 1"
+    )).fetchall()
+    for user_id, day in duplicates:
+        rows = conn.execute(sa.text(
+            f"SELECT id, {', '.join(COUNTER_COLUMNS)}, model_usage FROM usage_stats "
+            "WHERE user_id = :user_id AND day = :day ORDER BY id"
+        ), {"user_id": user_id, "day": day}).fetchall()
+        keep_id = rows[0][0]
+        totals = [sum(row[i + 1] or 0 for row in rows) for i in range(len(COUNTER_COLUMNS))]
+        model_usage = {}
+        for row in rows:
+            for model, count in json.loads(row[-1] or "{}").items():
+                model_usage[model] = model_usage.get(model, 0) + count
+        conn.execute(sa.text(
+            f"UPDATE usage_stats SET {', '.join(f'{column} = :{column}' for column in COUNTER_COLUMNS)}, "
+            "model_usage = :model_usage WHERE id = :id"
+        ), {**dict(zip(COUNTER_COLUMNS, totals)), "model_usage": json.dumps(model_usage), "id": keep_id})
+        conn.execute(sa.text(
+            "DELETE FROM usage_stats WHERE user_id = :user_id AND day = :day AND id != :id"
+        ), {"user_id": user_id, "day": day, "id": keep_id})
+
+    op.create_index('ux_usage_stats_user_day', 'usage_stats', ['user_id', 'day'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ux_usage_stats_user_day', table_name='usage_stats')
+    op.drop_column('usage_stats', 'day')
@@ -0,0 +1,45 @@
+"""dropped model_usage from user_usage_totals
+
+Revision ID: b6d4e8f2a913
+Revises: 8f2a6c1e4d70
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d4e8f2a913'
+down_revision: Union[str, Sequence[str], None] = '8f2a6c1e4d70'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Lifetime per-model counts are summed from usage_model_daily instead
+    with op.batch_alter_table('user_usage_totals', schema=None) as batch_op:
+        batch_op.drop_column('model_usage')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('user_usage_totals', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('model_usage', sqlmodel.sql.sqltypes.AutoString(), nullable=False, server_default='{}'))
+
+    conn = op.get_bind()
+    model_usage = {}
+    for user_id, model, messages in conn.execute(sa.text(
+        "SELECT user_id, model, SUM(messages) FROM usage_model_daily GROUP BY user_id, model"
+    )).fetchall():
+        model_usage.setdefault(user_id, {})[model] = messages
+    if model_usage:
+        conn.execute(
+            sa.text("UPDATE user_usage_totals SET model_usage = :model_usage WHERE user_id = :user_id"),
+            [{"user_id": user_id, "model_usage": json.dumps(counts)} for user_id, counts in model_usage.items()]
+        )
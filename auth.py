@@ -1,36 +1,66 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
-from h11 import Request
-from sqlmodel import Session
-from database import get_session
+from sqlmodel import update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import get_async_session, async_write_engine
 from models import Token, User
-from security import verify_password, create_access_token 
-from dependencies import get_user
+from security import create_access_token, password_hashing_pool
 from datetime import timedelta
 from config import settings
 from limiter import limiter
-from slowapi import Limiter
-from dependencies import get_user
+from dependencies import aget_user, require_admin
 
 router = APIRouter(
     prefix="/auth",
     tags=["authentication"],
 )
 
-def authenticate_user(session: Session, username: str, password: str) -> User | None:
-    user = get_user(session, username)
+async def _store_rehashed_password(user: User, new_hash: str):
+    async with AsyncSession(async_write_engine) as session:
+        # Only replace the hash that was just verified, not one set by a concurrent password reset
+        await session.exec(
+            update(User)
+            .where(User.id == user.id, User.hashed_password == user.hashed_password)
+            .values(hashed_password=new_hash)
+        )
+        await session.commit()
+    print(f"--- INFO: Rehashed password for user {user.id} with the current bcrypt cost ---")
+
+async def authenticate_user(session: AsyncSession, username: str, password: str) -> User | None:
+    user = await aget_user(session, username)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await password_hashing_pool.verify_and_update(password, user.hashed_password)
+    if not valid:
         return None
+    if new_hash:
+        await _store_rehashed_password(user, new_hash)
     return user
 
-LOGIN_RATE_LIMIT = "5/minute"
 @router.post("/token",response_model= Token)
-async def login_for_access_token(limiter: Limiter = Depends(lambda: limiter.limit(LOGIN_RATE_LIMIT)), form_data:OAuth2PasswordRequestForm = Depends(),session: Session = Depends(get_session)):
-    user = authenticate_user(session,form_data.username,form_data.password)
+async def login_for_access_token(request: Request, form_data:OAuth2PasswordRequestForm = Depends(),session: AsyncSession = Depends(get_async_session)):
+    # Keyed by client address and account: guessing is throttled, but an attacker elsewhere can't lock the user out
+    client_host = request.client.host if request.client else "unknown"
+    rate_key = f"login:{client_host}:{form_data.username.lower()}"
+    await limiter.enforce(rate_key, settings.login_rate_limit)
+    user = await authenticate_user(session,form_data.username,form_data.password)
+    if user:
+        # Only failed attempts count against the bucket
+        await limiter.refund(rate_key, settings.login_rate_limit)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="incorrect username or password",headers={"WWW-Authenticate":"Bearer"})
     access_token_expires = timedelta(minutes = settings.access_token_expire_minutes)
     access_token = create_access_token(data={"sub":user.username},expires_delta = access_token_expires)
-    return{"access_token":access_token,"token_type":"bearer"}
\ No newline at end of file
+    return{"access_token":access_token,"token_type":"bearer"}
+
+
+@router.get("/password-hashing/stats")
+def get_password_hashing_stats(admin_user: User = Depends(require_admin)):
+    """Queue depth, timings and rehash count for the password hashing pool."""
+    return password_hashing_pool.get_stats()
+
+
+@router.get("/rate-limits/stats")
+def get_rate_limit_stats(admin_user: User = Depends(require_admin)):
+    """Allowed/limited counts for this worker and the shared bucket backend in use."""
+    return limiter.get_stats()
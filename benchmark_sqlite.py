@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent chat message inserts against SQLite, with the default
+configuration and with the production profile from database.py (WAL, pragmas
+and a single serialized writer connection).
+
+Usage: python benchmark_sqlite.py [--threads 16] [--turns 50]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from sqlalchemy.exc import OperationalError
+from sqlmodel import SQLModel, Session, create_engine, select
+from database import apply_sqlite_profile, _engine_kwargs, _writer_kwargs
+from models import User, ChatSession, ChatMessage
+
+
+def setup_database(url: str, sessions: int) -> None:
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        user = User(username="bench", email="bench@example.com", hashed_password="x")
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+        for i in range(sessions):
+            session.add(ChatSession(title=f"bench {i}", user_id=user.id))
+        session.commit()
+    engine.dispose()
+
+
+def build_engines(url: str, tuned: bool):
+    if not tuned:
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+        return engine, engine
+    read_engine = create_engine(url, **_engine_kwargs(url))
+    write_engine = create_engine(url, **_writer_kwargs(url))
+    apply_sqlite_profile(read_engine)
+    apply_sqlite_profile(write_engine, writer=True)
+    return read_engine, write_engine
+
+
+def run(url: str, tuned: bool, threads: int, turns: int) -> dict:
+    read_engine, write_engine = build_engines(url, tuned)
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def chat_turns(session_id: int):
+        for turn in range(turns):
+            start = time.perf_counter()
+            try:
+                # One chat turn: read recent history, then store the prompt and the reply
+                with Session(read_engine) as session:
+                    session.exec(
+                        select(ChatMessage).where(ChatMessage.session_id == session_id)
+                        .order_by(ChatMessage.id.desc()).limit(20)
+                    ).all()
+                with Session(write_engine) as session:
+                    session.add(ChatMessage(content=f"prompt {turn}", role="user", session_id=session_id))
+                    session.commit()
+                with Session(write_engine) as session:
+                    session.add(ChatMessage(content=f"reply {turn} " + "x" * 500, role="model", session_id=session_id))
+                    session.commit()
+            except OperationalError as e:
+                with lock:
+                    errors.append(str(e.orig))
+                continue
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    workers = [threading.Thread(target=chat_turns, args=(i + 1,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    read_engine.dispose()
+    write_engine.dispose()
+
+    latencies.sort()
+    return {
+        "turns_ok": len(latencies),
+        "errors": len(errors),
+        "turns_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 1) if latencies else None,
+        "max_ms": round(latencies[-1], 1) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+
+    for label, tuned in (("default", False), ("tuned", True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            setup_database(url, args.threads)
+            result = run(url, tuned, args.threads, args.turns)
+        print(f"{label:>8}: {result}")
+
+
+if __name__ == "__main__":
+    main()
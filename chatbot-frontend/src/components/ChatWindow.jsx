@@ -113,18 +113,41 @@ import { ChevronRightIcon } from "lucide-react";
 import { Send, MessageCircle, Paperclip} from 'lucide-react';
 import ChatMessage from './ChatMessage';
 
-export default function ChatWindow({ messages, onSendMessage, isLoading, onFileUpload, fileInputRef, chatInputRef }) {
+export default function ChatWindow({ messages, onSendMessage, isLoading, onFileUpload, fileInputRef, chatInputRef, hasOlderMessages, isOlderLoading, onLoadOlder }) {
     const [input, setInput] = useState('');
     const messagesEndRef = useRef(null);
     const localInputRef = useRef(null);
+    const scrollContainerRef = useRef(null);
+    const lastMessageRef = useRef(null);
+    const prependScrollHeightRef = useRef(null);
 
     // Use the passed ref or create a local one
     const inputRef = chatInputRef || localInputRef;
 
     useEffect(() => {
-        messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
+        const container = scrollContainerRef.current;
+        if (prependScrollHeightRef.current !== null && container) {
+            // Older messages were added above; keep the viewport on the same message
+            container.scrollTop += container.scrollHeight - prependScrollHeightRef.current;
+            prependScrollHeightRef.current = null;
+        }
+        // Only follow the conversation when the newest message changed, not when older ones were loaded
+        const lastMessage = messages.length ? messages[messages.length - 1] : null;
+        if (lastMessage !== lastMessageRef.current) {
+            messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
+        }
+        lastMessageRef.current = lastMessage;
     }, [messages]);
 
+    const handleScroll = () => {
+        const container = scrollContainerRef.current;
+        if (!container || !onLoadOlder || !hasOlderMessages || isOlderLoading) return;
+        if (container.scrollTop < 80) {
+            prependScrollHeightRef.current = container.scrollHeight;
+            onLoadOlder();
+        }
+    };
+
     const handleSend = () => {
         if (input.trim()) {
             onSendMessage(input);
@@ -135,7 +158,12 @@ export default function ChatWindow({ messages, onSendMessage, isLoading, onFileU
     return (
         <div className="flex-1 flex flex-col bg-gradient-to-br from-background via-background to-secondary/20 min-h-0">
             {/* Messages Area */}
-            <div className="flex-1 p-6 overflow-y-auto min-h-0">
+            <div ref={scrollContainerRef} onScroll={handleScroll} className="flex-1 p-6 overflow-y-auto min-h-0">
+                {isOlderLoading && (
+                    <div className="text-center text-muted-foreground text-sm mb-4">
+                        Loading earlier messages...
+                    </div>
+                )}
                 {messages.length === 0 && !isLoading && (
                     <div className="flex flex-col items-center justify-center h-full text-muted-foreground">
                         <div className="relative mb-8">
@@ -117,7 +117,7 @@ const SessionItem = ({ session, onSelect, onDelete, onRename, activeSessionId })
 };
 
 
-export default function Sidebar({ sessions, onSelectSession, onNewChat, onDeleteSession, onRenameSession, activeSessionId, isLoading, isCollapsed, onToggleCollapse }) {
+export default function Sidebar({ sessions, onSelectSession, onNewChat, onDeleteSession, onRenameSession, activeSessionId, isLoading, isCollapsed, onToggleCollapse, hasMoreSessions, isMoreSessionsLoading, onLoadMoreSessions }) {
     const { logout } = useAuth();
     const { theme, toggleTheme } = useTheme();
 
@@ -203,6 +203,15 @@ export default function Sidebar({ sessions, onSelectSession, onNewChat, onDelete
                                 />
                             ))
                         )}
+                        {!isLoading && hasMoreSessions && (
+                            <button
+                                onClick={onLoadMoreSessions}
+                                disabled={isMoreSessionsLoading}
+                                className="w-full px-2 py-2 mt-1 text-sm text-[hsl(var(--muted-foreground))] hover:text-[hsl(var(--foreground))] hover:bg-[hsl(var(--accent))/50] rounded-lg transition-colors"
+                            >
+                                {isMoreSessionsLoading ? 'Loading...' : 'Load more'}
+                            </button>
+                        )}
                     </div>
 
                     {/* Settings Button - Use CSS variables */}
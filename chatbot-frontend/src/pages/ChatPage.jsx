@@ -13,10 +13,14 @@ import { Hand, PanelRight, Paperclip } from 'lucide-react';
 export default function ChatPage() {
     const { token } = useAuth();
     const [sessions, setSessions] = useState([]);
+    const [sessionsCursor, setSessionsCursor] = useState(null);
+    const [isMoreSessionsLoading, setIsMoreSessionsLoading] = useState(false);
     const [activeSession, setActiveSession] = useState(null);
     const [currentUser,SetCurrentUser] = useState(null);
     const [messages, setMessages] = useState([]);
     const [isLoading, setIsLoading] = useState(false);
+    const [hasOlderMessages, setHasOlderMessages] = useState(false);
+    const [isOlderLoading, setIsOlderLoading] = useState(false);
     const [isHistoryLoading, setIsHistoryLoading] = useState(false);
     const [isSidebarCollapsed, setIsSidebarCollapsed] = useState(false);
     const [availableModels, setAvailableModels] = useState({});
@@ -35,7 +39,8 @@ export default function ChatPage() {
         setIsHistoryLoading(true);
         try {
             const data = await api.getChatSessions(token);
-            setSessions(data);
+            setSessions(data.sessions);
+            setSessionsCursor(data.next_cursor);
 
             console.log('--- DEBUG: Fetched data:', data);
             console.log('--- DEBUG: Fetched sessions:', sessions);
@@ -46,6 +51,20 @@ export default function ChatPage() {
         }
     };
 
+    const fetchMoreSessions = async () => {
+        if (!token || !sessionsCursor || isMoreSessionsLoading) return;
+        setIsMoreSessionsLoading(true);
+        try {
+            const data = await api.getChatSessions(token, { cursor: sessionsCursor });
+            setSessions(prev => [...prev, ...data.sessions]);
+            setSessionsCursor(data.next_cursor);
+        } catch (error) {
+            console.error("Failed to fetch more sessions:", error);
+        } finally {
+            setIsMoreSessionsLoading(false);
+        }
+    };
+
     const fetchAvailableModels = async () => {
         if (!token) return;
         setIsModelsLoading(true);
@@ -68,6 +87,7 @@ export default function ChatPage() {
     const handleNewChat = () => {
         setActiveSession(null);
         setMessages([]);
+        setHasOlderMessages(false);
     };
 
     const handleSelectSession = async (sessionId) => {
@@ -76,14 +96,31 @@ export default function ChatPage() {
         try {
             const data = await api.getChatHistory(token, sessionId);
             setMessages(data.messages);
+            setHasOlderMessages(data.has_more);
         } catch (error) {
             console.error("Failed to fetch chat history:", error);
             setMessages([]);
+            setHasOlderMessages(false);
         } finally {
             setIsLoading(false);
         }
     };
 
+    // Loads the page before the oldest message on screen when the user scrolls to the top
+    const handleLoadOlderMessages = async () => {
+        if (!activeSession || !hasOlderMessages || isOlderLoading || messages.length === 0) return;
+        setIsOlderLoading(true);
+        try {
+            const data = await api.getChatHistory(token, activeSession, { before: messages[0].id });
+            setMessages(prev => [...data.messages, ...prev]);
+            setHasOlderMessages(data.has_more);
+        } catch (error) {
+            console.error("Failed to fetch older messages:", error);
+        } finally {
+            setIsOlderLoading(false);
+        }
+    };
+
     // Keyboard shortcuts handlers
     const handleFocusInput = () => {
         if (chatInputRef.current) {
@@ -265,8 +302,19 @@ export default function ChatPage() {
 
         try {
             const response = await api.uploadDocument(token, activeSession, file);
-            alert(`Successfully uploaded ${file.name}!`);
             console.log(response.message);
+
+            // Processing happens in the background; poll the job until it finishes
+            let job = response;
+            while (job.status === 'queued' || job.status === 'running') {
+                await new Promise(resolve => setTimeout(resolve, 1500));
+                job = await api.getIngestionJob(token, response.job_id);
+                console.log(`--- DEBUG: Ingestion ${job.status}: ${job.chunks_stored}/${job.chunks_total} chunks stored ---`);
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.error || 'Document processing failed');
+            }
+            alert(`Successfully uploaded ${file.name}!`);
         } catch (error) {
             console.error("File upload failed:", error);
             alert("Failed to upload the document. Please try again.");
@@ -287,6 +335,9 @@ export default function ChatPage() {
                 onRenameSession={handleRenameSession}
                 activeSessionId={activeSession}
                 isLoading={isHistoryLoading}
+                hasMoreSessions={Boolean(sessionsCursor)}
+                isMoreSessionsLoading={isMoreSessionsLoading}
+                onLoadMoreSessions={fetchMoreSessions}
             />
             <div className="flex flex-col flex-1 min-h-0">
                 <ChatSettings
@@ -304,6 +355,9 @@ export default function ChatPage() {
                     onFileUpload={handleFileUpload}
                     fileInputRef={fileInputRef}
                     chatInputRef={chatInputRef}
+                    hasOlderMessages={hasOlderMessages}
+                    isOlderLoading={isOlderLoading}
+                    onLoadOlder={handleLoadOlderMessages}
                 />
             </div>
             
@@ -145,10 +145,12 @@ export const api = {
         }
     },
 
-    async getChatSessions(token) {
+    // Returns { sessions, next_cursor }, most recently active first; pass `cursor` for the next page
+    async getChatSessions(token, { cursor, limit } = {}) {
         try {
             const response = await apiClient.get('/chats/', {
-                headers: { 'Authorization': `Bearer ${token}` }
+                headers: { 'Authorization': `Bearer ${token}` },
+                params: { cursor, limit }
             });
             return response.data;
         } catch (error) {
@@ -157,10 +159,12 @@ export const api = {
         }
     },
 
-    async getChatHistory(token, sessionId) {
+    // Returns one page of messages; pass `before` (oldest loaded message id) to page back
+    async getChatHistory(token, sessionId, { before, limit } = {}) {
         try {
             const response = await apiClient.get(`/chats/${sessionId}`, {
-                headers: { 'Authorization': `Bearer ${token}` }
+                headers: { 'Authorization': `Bearer ${token}` },
+                params: { before, limit }
             });
             return response.data;
         } catch (error) {
@@ -191,6 +195,18 @@ export const api = {
         return await response.json();
     },
 
+    async getIngestionJob(token, jobId) {
+        try {
+            const response = await apiClient.get(`/rag/jobs/${jobId}`, {
+                headers: { 'Authorization': `Bearer ${token}` }
+            });
+            return response.data;
+        } catch (error) {
+            console.error('Failed to fetch ingestion job:', error.response?.data || error.message);
+            throw new Error('Failed to fetch ingestion job');
+        }
+    },
+
     async getAvailableModels(token) {
         try {
             const response = await apiClient.get('/chats/models', {
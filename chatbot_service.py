@@ -66,6 +66,8 @@
 
 import os
 import re
+import time
+import asyncio
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_openai import ChatOpenAI
 from langchain_groq import ChatGroq
@@ -74,9 +76,10 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 from langchain_core.runnables import RunnablePassthrough
 from rag_service import get_session_retriever,get_session_retriever_with_scores
-from web_search_service import TavilySearchService
+from web_search_service import search_service
+from model_registry import model_registry
 from config import settings
-from typing import List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional
 from operator import itemgetter
 
 
@@ -114,7 +117,9 @@ MODELS = {
     },
     "llama3-70b-8192": {
         "provider": "groq",
-        "model_name": "llama3-70b-8192"
+        "model_name": "llama3-70b-8192",
+        # 8k context window: leave room for documents, web results and the answer
+        "history_token_budget": 2500
     },
     "meta-llama/llama-4-maverick-17b-128e-instruct": {
         "provider": "groq",
@@ -140,17 +145,57 @@ MODELS = {
 }
 
 
-def get_model_instance(model_name: str = "gemini-1.5-flash"):
-    """
-    Get the appropriate model instance based on model name
-    """
+def _resolve_model_config(model_name: str) -> tuple[str, str]:
     if model_name not in MODELS:
         raise ValueError(f"Unknown model: {model_name}. Available models: {list(MODELS.keys())}")
-    
+
     model_config = MODELS[model_name]
-    provider = model_config["provider"]
-    actual_model_name = model_config["model_name"]
-    
+    return model_config["provider"], model_config["model_name"]
+
+
+def get_history_token_budget(model_name: str) -> int:
+    """Token budget for the chat history sent with a prompt to this model."""
+    return MODELS.get(model_name, {}).get("history_token_budget", settings.history_token_budget)
+
+
+def get_model_rate_limit(model_name: str) -> Optional[str]:
+    """Per-user rate limit for this model on top of the chat-wide one, if any."""
+    return MODELS.get(model_name, {}).get("rate_limit", settings.chat_model_rate_limit)
+
+
+def get_model_instance(model_name: str = "gemini-1.5-flash"):
+    """
+    Get the appropriate model instance based on model name.
+    Clients are pooled process-wide so connections are reused across chat turns.
+    """
+    provider, actual_model_name = _resolve_model_config(model_name)
+    return model_registry.get_or_create(
+        provider,
+        actual_model_name,
+        lambda: _build_model_client(provider, actual_model_name)
+    )
+
+
+def evict_model_instance(model_name: str) -> bool:
+    """Drop the pooled client for a model so the next request builds a fresh one."""
+    provider, actual_model_name = _resolve_model_config(model_name)
+    return model_registry.evict(provider, actual_model_name)
+
+
+def reload_model_instance(model_name: str):
+    """Rebuild the pooled client for a model immediately."""
+    provider, actual_model_name = _resolve_model_config(model_name)
+    return model_registry.reload(
+        provider,
+        actual_model_name,
+        lambda: _build_model_client(provider, actual_model_name)
+    )
+
+
+def _build_model_client(provider: str, actual_model_name: str):
+    """
+    Construct a new client for the provider. Only called by the model registry.
+    """
     if provider == "google":
         return ChatGoogleGenerativeAI(
             model=actual_model_name,
@@ -171,11 +216,41 @@ def get_model_instance(model_name: str = "gemini-1.5-flash"):
         raise ValueError(f"Unknown provider: {provider}")
 
 
+CHAT_SYSTEM_MESSAGE = (
+    "You are a helpful assistant. You provide concise answers based on the provided context. "
+    "Format your responses using GitHub-flavored Markdown."
+)
+
+RAG_REJECTION_MESSAGE = "I cannot answer this question as I don't find sufficient relevant information in the uploaded documents. Please ensure your question is related to the content of the uploaded files."
+
+RAG_TIMEOUT_MESSAGE = "Searching your documents took too long, so I couldn't answer this time. Please try again in a moment."
+
+STREAM_ERROR_MESSAGE = "Sorry, I encountered an error while processing your request."
+
+
+def _build_chat_chain(llm, web_search_context: str = ""):
+    # Create system prompt with optional web search context
+    system_message = CHAT_SYSTEM_MESSAGE
+    
+    if web_search_context:
+        system_message += f"\n\nHere is some relevant information from web search:\n\n{web_search_context}"
+    
+    prompt_template = ChatPromptTemplate.from_messages([
+        ("system", system_message),
+        MessagesPlaceholder(variable_name="chat_history"),
+        ("user", "{input}")
+    ])
+   
+    output_parser = StrOutputParser()
+    return prompt_template | llm | output_parser
+
+
 def get_chatbot_response(
     prompt: str, 
     chat_history: List[BaseMessage], 
     model_name: str = "gemini-1.5-flash",
-    use_web_search: bool = False
+    use_web_search: bool = False,
+    callbacks: Optional[list] = None
 ):
     """
     Initializes the chatbot model and gets a streaming response,
@@ -186,28 +261,11 @@ def get_chatbot_response(
     # Initialize web search if enabled
     web_search_context = ""
     if use_web_search:
-        search_service = TavilySearchService()
         search_results = search_service.search(prompt)
         if search_results:
             web_search_context = search_service.format_search_results(search_results)
     
-    # Create system prompt with optional web search context
-    system_message = (
-        "You are a helpful assistant. You provide concise answers based on the provided context. "
-        "Format your responses using GitHub-flavored Markdown."
-    )
-    
-    if web_search_context:
-        system_message += f"\n\nHere is some relevant information from web search:\n\n{web_search_context}"
-    
-    prompt_template = ChatPromptTemplate.from_messages([
-        ("system", system_message),
-        MessagesPlaceholder(variable_name="chat_history"),
-        ("user", "{input}")
-    ])
-   
-    output_parser = StrOutputParser()
-    chain = prompt_template | llm | output_parser
+    chain = _build_chat_chain(llm, web_search_context)
    
     try:
         print(f"--- DEBUG: Using model: {model_name} ---")
@@ -218,16 +276,50 @@ def get_chatbot_response(
         response_stream = chain.stream({
             "input": prompt,
             "chat_history": chat_history
-        })
+        }, config={"callbacks": callbacks or []})
 
         for chunk in response_stream:
             yield chunk
 
     except Exception as e:
         print(f"--- DEBUG: Error streaming from LangChain: {e}")
-        yield "Sorry, I encountered an error while processing your request."
+        yield STREAM_ERROR_MESSAGE
 
 
+async def aget_chatbot_response(
+    prompt: str,
+    chat_history: List[BaseMessage],
+    model_name: str = "gemini-1.5-flash",
+    use_web_search: bool = False,
+    context: Optional["GenerationContext"] = None,
+    callbacks: Optional[list] = None
+):
+    """
+    Async counterpart of get_chatbot_response(). Streams with chain.astream so an open
+    stream never holds a threadpool worker. `context` carries pre-generation results
+    from prepare_generation_context(); it is computed here if not given.
+    """
+    llm = get_model_instance(model_name)
+
+    if context is None:
+        context = await prepare_generation_context(prompt, None, False, use_web_search)
+
+    chain = _build_chat_chain(llm, context.web_search_context)
+
+    try:
+        print(f"--- DEBUG: Using model: {model_name} (async) ---")
+        print(f"--- DEBUG: Web search enabled: {use_web_search} ---")
+        print(f"--- DEBUG: Chat history length: {len(chat_history)} ---")
+
+        async for chunk in chain.astream({
+            "input": prompt,
+            "chat_history": chat_history
+        }, config={"callbacks": callbacks or []}):
+            yield chunk
+
+    except Exception as e:
+        print(f"--- DEBUG: Error streaming from LangChain: {e}")
+        yield STREAM_ERROR_MESSAGE
 
 
 def check_document_relevance(retriever, query: str, min_docs: int = 2) -> tuple[list, bool]:
@@ -237,74 +329,42 @@ def check_document_relevance(retriever, query: str, min_docs: int = 2) -> tuple[
     """
     try:
         retrieved_docs = retriever.get_relevant_documents(query)
-        print(f"--- DEBUG: Retrieved {len(retrieved_docs)} documents after filtering ---")
-        
-        is_sufficient = len(retrieved_docs) >= min_docs
-        
-        if not is_sufficient:
-            print(f"--- INFO: Insufficient documents ({len(retrieved_docs)}) for query, minimum required: {min_docs} ---")
-            # return retrieved_docs[0], True
-        print(retrieved_docs[0].page_content)
-        return retrieved_docs, is_sufficient
+        return _evaluate_retrieved_docs(retrieved_docs, min_docs)
         
     except Exception as e:
         print(f"--- ERROR: Document retrieval failed: {e} ---")
         return [], False
-    
 
-def get_model(model_name:str = "gemini-1.5-flash"):
-    if model_name == "gemini-1.5-flash":
-        return ChatGoogleGenerativeAI(model="models/gemini-1.5-flash", google_api_key=settings.google_api_key)
-    elif model_name == "llama3-70b-8192":
-        return ChatGroq(
-            model="llama3-70b-8192",
-            temperature=0.2,
-            max_tokens=None,
-            timeout=None,
-            max_retries=2,
-            api_key=settings.grok_api_key,  # Optional if you set GROQ_API_KEY
-            streaming=True
-        )
-    else:
-        raise ValueError(f"Unknown model name: {model_name}")
 
+async def acheck_document_relevance(retriever, query: str, min_docs: int = 2, run_stage=None) -> tuple[list, bool]:
+    """Async counterpart of check_document_relevance()."""
+    try:
+        retrieved_docs = await retriever.aget_relevant_documents(query, run_stage)
+        return _evaluate_retrieved_docs(retrieved_docs, min_docs)
 
-def get_rag_chatbot_response(
-    prompt: str, 
-    chat_history: List[BaseMessage], 
-    session_id: int,
-    model_name: str = "gemini-1.5-flash",
-    use_web_search: bool = False
-):
-    """
-    Generates a streaming RAG response using conversational context and retrieved documents
-    filtered by the session_id with model selection and optional web search.
-    """
-    model = get_model_instance(model_name)
-    
-    # Initialize web search if enabled
-    web_search_context = ""
-    if use_web_search:
-        search_service = TavilySearchService()
-        search_results = search_service.search(prompt)
-        if search_results:
-            web_search_context = search_service.format_search_results(search_results)
+    except Exception as e:
+        print(f"--- ERROR: Document retrieval failed: {e} ---")
+        return [], False
 
-    retriever = get_session_retriever_with_scores(session_id, similarity_threshold=0.95)
 
-    retrieved_docs, has_sufficient_docs = check_document_relevance(retriever, prompt, min_docs=1)
-    if not has_sufficient_docs:
-        print(f"--- INFO: Rejecting query due to insufficient relevant documents ---")
-        def rejection_generator():
-            yield "I cannot answer this question as I don't find sufficient relevant information in the uploaded documents. Please ensure your question is related to the content of the uploaded files."
-        return rejection_generator()
+def _evaluate_retrieved_docs(retrieved_docs: list, min_docs: int) -> tuple[list, bool]:
+    print(f"--- DEBUG: Retrieved {len(retrieved_docs)} documents after filtering ---")
     
+    is_sufficient = len(retrieved_docs) >= min_docs
+    
+    if not is_sufficient:
+        print(f"--- INFO: Insufficient documents ({len(retrieved_docs)}) for query, minimum required: {min_docs} ---")
+    if retrieved_docs:
+        print(retrieved_docs[0].page_content)
+    return retrieved_docs, is_sufficient
+    
+
+def _build_rag_chain(model, retrieved_docs: list, web_search_context: str = ""):
     def format_docs(docs_list):
         if not docs_list:
             return "No relevant documents found."
         return "\n\n".join(doc.page_content for doc in docs_list)
 
-    # Create system prompt with optional web search context
     system_message = (
         """You are a document analysis assistant. Your ONLY job is to answer questions based STRICTLY on the provided context from uploaded documents.
 
@@ -343,10 +403,7 @@ Remember: It's better to say "I don't know based on the documents" than to provi
         ("user", "{input}")
     ])
 
-    print(f"--- DEBUG: Creating RAG chain for session_id: {session_id} with model: {model_name} ---")
-    print(f"--- DEBUG: Web search enabled: {use_web_search} ---")
-    
-    rag_chain = (
+    return (
         {
             "context": lambda x: format_docs(retrieved_docs),
             "input": itemgetter("input"),
@@ -356,10 +413,185 @@ Remember: It's better to say "I don't know based on the documents" than to provi
         | model
         | StrOutputParser()
     )
+
+
+def get_rag_chatbot_response(
+    prompt: str, 
+    chat_history: List[BaseMessage], 
+    session_id: int,
+    model_name: str = "gemini-1.5-flash",
+    use_web_search: bool = False,
+    callbacks: Optional[list] = None
+):
+    """
+    Generates a streaming RAG response using conversational context and retrieved documents
+    filtered by the session_id with model selection and optional web search.
+    """
+    model = get_model_instance(model_name)
+    
+    # Initialize web search if enabled
+    web_search_context = ""
+    if use_web_search:
+        search_results = search_service.search(prompt)
+        if search_results:
+            web_search_context = search_service.format_search_results(search_results)
+
+    retriever = get_session_retriever_with_scores(session_id, similarity_threshold=0.95)
+
+    retrieved_docs, has_sufficient_docs = check_document_relevance(retriever, prompt, min_docs=1)
+    if not has_sufficient_docs:
+        print(f"--- INFO: Rejecting query due to insufficient relevant documents ---")
+        def rejection_generator():
+            yield RAG_REJECTION_MESSAGE
+        return rejection_generator()
+
+    print(f"--- DEBUG: Creating RAG chain for session_id: {session_id} with model: {model_name} ---")
+    print(f"--- DEBUG: Web search enabled: {use_web_search} ---")
+    
+    rag_chain = _build_rag_chain(model, retrieved_docs, web_search_context)
     
     print(f"--- DEBUG: RAG chain created for session_id: {session_id} ---")
     return rag_chain.stream({
         "input": prompt,
         "chat_history": chat_history
-    })
+    }, config={"callbacks": callbacks or []})
+
 
+async def aget_rag_chatbot_response(
+    prompt: str,
+    chat_history: List[BaseMessage],
+    session_id: int,
+    model_name: str = "gemini-1.5-flash",
+    use_web_search: bool = False,
+    context: Optional["GenerationContext"] = None,
+    callbacks: Optional[list] = None
+):
+    """
+    Async counterpart of get_rag_chatbot_response(). Web search, retrieval and
+    generation are all awaited instead of blocking a worker thread.
+    """
+    model = get_model_instance(model_name)
+
+    if context is None:
+        context = await prepare_generation_context(prompt, session_id, True, use_web_search)
+
+    if not context.has_sufficient_docs:
+        if context.retrieval_degraded:
+            print(f"--- INFO: No documents found after document search timed out or failed ---")
+            yield RAG_TIMEOUT_MESSAGE
+            return
+        print(f"--- INFO: Rejecting query due to insufficient relevant documents ---")
+        yield RAG_REJECTION_MESSAGE
+        return
+
+    print(f"--- DEBUG: Creating async RAG chain for session_id: {session_id} with model: {model_name} ---")
+    rag_chain = _build_rag_chain(model, context.retrieved_docs, context.web_search_context)
+
+    try:
+        async for chunk in rag_chain.astream({
+            "input": prompt,
+            "chat_history": chat_history
+        }, config={"callbacks": callbacks or []}):
+            yield chunk
+
+    except Exception as e:
+        print(f"--- DEBUG: Error streaming from LangChain: {e}")
+        yield STREAM_ERROR_MESSAGE
+
+
+class StageTimer:
+    """Runs pre-generation stages with deadlines and records how long each took."""
+
+    def __init__(self):
+        self.timings: Dict[str, Dict] = {}
+
+    async def run(self, name: str, awaitable, deadline: float, default=None):
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            return await asyncio.wait_for(awaitable, timeout=deadline)
+        except asyncio.TimeoutError:
+            status = "timeout"
+            print(f"--- INFO: Stage '{name}' missed its {deadline}s deadline, continuing without it ---")
+            return default
+        except Exception as e:
+            status = "error"
+            print(f"--- ERROR: Stage '{name}' failed: {e} ---")
+            return default
+        finally:
+            self.timings[name] = {
+                "ms": round((time.perf_counter() - start) * 1000, 1),
+                "status": status,
+            }
+
+
+class GenerationContext:
+    """Everything gathered before the first token: history, web search and retrieved documents."""
+
+    def __init__(self):
+        self.chat_history: Optional[List[BaseMessage]] = None
+        self.web_search_context = ""
+        self.retrieved_docs: list = []
+        self.has_sufficient_docs = False
+        # Dense retrieval missed its deadline or failed, so "no documents" doesn't mean "nothing relevant"
+        self.retrieval_degraded = False
+        self.timings: Dict[str, Dict] = {}
+
+    def server_timing(self) -> str:
+        """Formats the stage timings as a Server-Timing header value."""
+        return ", ".join(
+            f'{name};dur={timing["ms"]};desc="{timing["status"]}"'
+            for name, timing in self.timings.items()
+        )
+
+
+async def prepare_generation_context(
+    prompt: str,
+    session_id: Optional[int],
+    has_documents: bool,
+    use_web_search: bool,
+    load_history: Optional[Callable[[], Awaitable[List[BaseMessage]]]] = None
+) -> GenerationContext:
+    """
+    Runs the pre-generation stages concurrently instead of one after another:
+    history loading, web search and (for document sessions) query embedding
+    followed by vector search. Each stage has its own deadline; history and web
+    search are optional and are dropped if they miss it.
+    """
+    timer = StageTimer()
+    context = GenerationContext()
+    start = time.perf_counter()
+
+    async def web_search() -> str:
+        search_results = await search_service.asearch(prompt)
+        if search_results:
+            return search_service.format_search_results(search_results)
+        return ""
+
+    async def retrieval() -> tuple[list, bool]:
+        retriever = await asyncio.to_thread(get_session_retriever_with_scores, session_id, 0.95)
+        return await acheck_document_relevance(retriever, prompt, min_docs=1, run_stage=timer.run)
+
+    async def no_op(value=None):
+        return value
+
+    history, web_search_context, (retrieved_docs, has_sufficient_docs) = await asyncio.gather(
+        timer.run("history", load_history(), settings.history_deadline_seconds, default=[])
+        if load_history else no_op(),
+        timer.run("web_search", web_search(), settings.web_search_deadline_seconds, default="")
+        if use_web_search else no_op(""),
+        retrieval() if has_documents else no_op(([], False)),
+    )
+
+    context.chat_history = history
+    context.web_search_context = web_search_context
+    context.retrieved_docs = retrieved_docs
+    context.has_sufficient_docs = has_sufficient_docs
+    context.retrieval_degraded = any(
+        timer.timings.get(stage, {}).get("status") in ("timeout", "error")
+        for stage in ("query_embedding", "vector_search")
+    )
+    context.timings = dict(timer.timings)
+    context.timings["pre_generation"] = {"ms": round((time.perf_counter() - start) * 1000, 1), "status": "ok"}
+    print(f"--- INFO: Pre-generation stage timings: {context.timings} ---")
+    return context
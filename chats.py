@@ -1,20 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlmodel import Session, select
-from typing import List, Optional
+from sqlmodel.ext.asyncio.session import AsyncSession
+import base64
+import binascii
+from datetime import datetime
+from typing import List, Optional, Tuple
 from pydantic import BaseModel
 from fastapi import Body
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from limiter import limiter
-from database import get_session
+from database import get_write_session, get_async_session, get_async_write_session, engine, write_engine, async_write_engine
 from models import User, ChatSession, ChatMessage
-from dependencies import get_current_active_user
-from chatbot_service import get_chatbot_response, get_rag_chatbot_response, MODELS
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from langchain_core.messages import HumanMessage, AIMessage
+from dependencies import get_current_active_user, require_admin
+from chatbot_service import get_chatbot_response, get_rag_chatbot_response, aget_chatbot_response, aget_rag_chatbot_response, prepare_generation_context, GenerationContext, get_history_token_budget, get_model_rate_limit, MODELS, evict_model_instance, reload_model_instance
+from model_registry import model_registry
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from usage_tracker import UsageTracker
+from token_counter import TokenUsageCallback
+from history_service import load_history_window, message_page_statement, session_page_statement, to_langchain_messages
+from summary_service import conversation_summarizer
+from config import settings
 
-CHAT_RATE_LIMIT = "30/minute"
 router = APIRouter(
     prefix="/chats",
     tags=["Chats"],
@@ -32,10 +39,22 @@ class ChatSessionResponse(BaseModel):
     id: int
     title: str
 
+class ChatSessionListItem(BaseModel):
+    id: int
+    title: str
+    last_activity_at: datetime
+
+class ChatSessionPage(BaseModel):
+    sessions: List[ChatSessionListItem]
+    # Pass back as `cursor` to fetch the next page; None on the last page
+    next_cursor: Optional[str] = None
+
 class ChatHistoryResponse(BaseModel):
     id: int
     title: str
     messages: List[ChatMessageResponse]
+    # More messages exist beyond this page in the direction it was read
+    has_more: bool = False
 
 class NewChatMessageRequest(BaseModel):
     prompt: str
@@ -135,10 +154,10 @@ def stream_and_save_response_with_headers(
     prompt: str, 
     chat_session_id: int, 
     chat_history: list, 
-    db_session: Session,
+    has_documents: bool,
+    user_id: int,
     model_name: str = "gemini-1.5-flash",
-    use_web_search: bool = False,
-    current_user:User = Depends(get_current_active_user)
+    use_web_search: bool = False
 ):
     """
     Streams the chatbot response and saves the full message.
@@ -148,21 +167,19 @@ def stream_and_save_response_with_headers(
     print(f"--- DEBUG: Web search enabled: {use_web_search} ---")
     print(f"--- DEBUG: Chat history length being passed: {len(chat_history)} ---")
 
-    chat_session = db_session.get(ChatSession, chat_session_id)
-    if not chat_session:
-        # This is a fallback, though the main endpoint should prevent this
-        raise HTTPException(status_code=404, detail="Chat session not found during streaming")
+    # Counts prompt and completion tokens while the response streams
+    usage = TokenUsageCallback(MODELS.get(model_name, {}).get("provider"))
 
     # THE CORE LOGIC: Decide which response generator to use
-    if chat_session.has_documents:
+    if has_documents:
         print(f"--- INFO: Using RAG chain for session {chat_session_id} ---")
         response_generator = get_rag_chatbot_response(
-            prompt, chat_history, chat_session_id, model_name, use_web_search
+            prompt, chat_history, chat_session_id, model_name, use_web_search, callbacks=[usage]
         )
     else:
         print(f"--- INFO: Using standard chain for session {chat_session_id} ---")
         response_generator = get_chatbot_response(
-            prompt, chat_history, model_name, use_web_search
+            prompt, chat_history, model_name, use_web_search, callbacks=[usage]
         )
 
     full_bot_response = ""
@@ -177,40 +194,108 @@ def stream_and_save_response_with_headers(
         role="model",
         session_id=chat_session_id
     )
-    db_session.add(bot_message_to_save)
     
     try:
-        db_session.commit()
+        # Same single writer as the async path, so the save takes BEGIN IMMEDIATE
+        with Session(write_engine) as db_session:
+            db_session.add(bot_message_to_save)
+            db_session.commit()
         print(f"--- DEBUG: Successfully saved bot response to DB for session {chat_session_id} ---")
+        conversation_summarizer.schedule(chat_session_id, model_name)
         
         # Track usage statistics
         try:
-            # Estimate tokens (rough approximation: 1 token ≈ 4 characters)
-            estimated_tokens = len(full_bot_response) // 4
             UsageTracker.track_message(
-                user_id=current_user.id,
-                tokens_used=estimated_tokens,
+                user_id=user_id,
                 model_name=model_name,
-                web_search_used=use_web_search
+                web_search_used=use_web_search,
+                prompt_tokens=usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens
             )
-            print(f"--- DEBUG: Usage tracked for user {current_user.id} ---")
+            print(f"--- DEBUG: Usage tracked for user {user_id} ---")
         except Exception as tracking_error:
             print(f"--- DEBUG: Error tracking usage: {tracking_error} ---")
             
     except Exception as e:
         print(f"--- DEBUG: Error saving bot response to DB: {e} ---")
-        db_session.rollback()
         raise
 
 
-@router.post("/", summary="Post a new message and get a streaming response")
-def post_new_message(
-    *,
-    limiter: Limiter = Depends(lambda: limiter.limit(CHAT_RATE_LIMIT)),
-    request_data: NewChatMessageRequest,
-    db_session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_active_user),
+async def _save_bot_response(chat_session_id: int, content: str):
+    async with AsyncSession(async_write_engine) as db_session:
+        db_session.add(ChatMessage(content=content, role="model", session_id=chat_session_id))
+        await db_session.commit()
+
+
+async def astream_and_save_response_with_headers(
+    prompt: str,
+    chat_session_id: int,
+    chat_history: list,
+    has_documents: bool,
+    user_id: int,
+    model_name: str = "gemini-1.5-flash",
+    use_web_search: bool = False,
+    context: GenerationContext | None = None
 ):
+    """
+    Async variant of stream_and_save_response_with_headers(). Generation runs on the
+    event loop via astream, so an open stream does not pin a threadpool worker.
+    """
+    print(f"--- DEBUG: Starting async stream for session {chat_session_id} with model {model_name} ---")
+
+    # Counts prompt and completion tokens while the response streams
+    usage = TokenUsageCallback(MODELS.get(model_name, {}).get("provider"))
+
+    if has_documents:
+        print(f"--- INFO: Using RAG chain for session {chat_session_id} ---")
+        response_generator = aget_rag_chatbot_response(
+            prompt, chat_history, chat_session_id, model_name, use_web_search, context, callbacks=[usage]
+        )
+    else:
+        print(f"--- INFO: Using standard chain for session {chat_session_id} ---")
+        response_generator = aget_chatbot_response(
+            prompt, chat_history, model_name, use_web_search, context, callbacks=[usage]
+        )
+
+    full_bot_response = ""
+    async for chunk in response_generator:
+        full_bot_response += chunk
+        yield chunk
+
+    print(f"--- DEBUG: Finished streaming. Full response: '{full_bot_response[:100]}...' ---")
+
+    try:
+        await _save_bot_response(chat_session_id, full_bot_response)
+        print(f"--- DEBUG: Successfully saved bot response to DB for session {chat_session_id} ---")
+        conversation_summarizer.schedule(chat_session_id, model_name)
+    except Exception as e:
+        print(f"--- DEBUG: Error saving bot response to DB: {e} ---")
+        raise
+
+    # Track usage statistics
+    try:
+        # Buffered in memory and flushed in the background, so no threadpool hop is needed
+        UsageTracker.track_message(
+            user_id=user_id,
+            model_name=model_name,
+            web_search_used=use_web_search,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens
+        )
+        print(f"--- DEBUG: Usage tracked for user {user_id} ({usage.total_tokens} tokens, {usage.source}) ---")
+    except Exception as tracking_error:
+        print(f"--- DEBUG: Error tracking usage: {tracking_error} ---")
+
+
+async def _prepare_chat_session(
+    db_session: AsyncSession,
+    request_data: NewChatMessageRequest,
+    user_id: int
+) -> tuple[int, bool, bool, int]:
+    """
+    Finds or creates the chat session and saves the user's prompt.
+    Returns (chat_session_id, has_documents, session_was_created, user_message_id).
+    """
     chat_session = None
     # *** CHANGE: Track if we created a new session ***
     session_was_created = False
@@ -218,94 +303,150 @@ def post_new_message(
     if request_data.session_id:
         # *** ENHANCED DEBUG: Log the session ID being requested ***
         print(f"--- DEBUG: Looking for existing session ID: {request_data.session_id} ---")
-        chat_session = db_session.get(ChatSession, request_data.session_id)
-        if not chat_session or chat_session.user_id != current_user.id:
+        chat_session = await db_session.get(ChatSession, request_data.session_id)
+        if not chat_session or chat_session.user_id != user_id:
             raise HTTPException(status_code=404, detail="Chat session not found")
         print(f"--- DEBUG: Using existing session {chat_session.id} ---")
     else:
         # *** ENHANCED DEBUG: Log new session creation ***
         print(f"--- DEBUG: No session_id provided, creating new session ---")
         title = request_data.prompt[:100] if len(request_data.prompt) > 100 else request_data.prompt
-        chat_session = ChatSession(title=title, user_id=current_user.id)
+        chat_session = ChatSession(title=title, user_id=user_id)
         db_session.add(chat_session)
         
         try:
-            db_session.commit()
-            db_session.refresh(chat_session)
+            await db_session.commit()
+            await db_session.refresh(chat_session)
             session_was_created = True  # *** CHANGE: Mark that we created a new session ***
             print(f"--- DEBUG: Created NEW chat session with ID: {chat_session.id} ---")
             
             # Track session creation
             try:
-                UsageTracker.track_session_created(current_user.id)
-                print(f"--- DEBUG: Session creation tracked for user {current_user.id} ---")
+                UsageTracker.track_session_created(user_id)
+                print(f"--- DEBUG: Session creation tracked for user {user_id} ---")
             except Exception as tracking_error:
                 print(f"--- DEBUG: Error tracking session creation: {tracking_error} ---")
                 
         except Exception as e:
             print(f"--- DEBUG: Error creating chat session: {e} ---")
-            db_session.rollback()
+            await db_session.rollback()
             raise HTTPException(status_code=500, detail="Failed to create chat session")
 
+    chat_session_id = chat_session.id
+    has_documents = chat_session.has_documents
+
     # Save the user message
     user_message = ChatMessage(
         content=request_data.prompt, 
         role="user", 
-        session_id=chat_session.id
+        session_id=chat_session_id
     )
     db_session.add(user_message)
     
     try:
-        db_session.commit()
-        print(f"--- DEBUG: User message saved for session {chat_session.id} ---")
+        await db_session.commit()
+        print(f"--- DEBUG: User message saved for session {chat_session_id} ---")
     except Exception as e:
         print(f"--- DEBUG: Error saving user message: {e} ---")
-        db_session.rollback()
+        await db_session.rollback()
         raise HTTPException(status_code=500, detail="Failed to save user message")
 
-    # Fetch chat history (excluding current message)
-    statement = (
-        select(ChatMessage)
-        .where(ChatMessage.session_id == chat_session.id)
-        .order_by(ChatMessage.created_at)
-        .limit(20)
+    return chat_session_id, has_documents, session_was_created, user_message.id
+
+
+def _load_chat_history(chat_session_id: int, model_name: str, before_message_id: int) -> list:
+    """
+    Loads the session's rolling summary plus the most recent turns that fit the
+    model's token budget, formatted for LangChain.
+    """
+    with Session(engine) as db_session:
+        chat_session = db_session.get(ChatSession, chat_session_id)
+        summary = chat_session.summary if chat_session else None
+        db_messages = load_history_window(
+            db_session,
+            chat_session_id,
+            get_history_token_budget(model_name),
+            before_message_id=before_message_id,
+            after_message_id=chat_session.summary_through_message_id if chat_session else None,
+            provider=MODELS.get(model_name, {}).get("provider")
+        )
+    print(f"--- DEBUG: Loaded {len(db_messages)} history messages for session {chat_session_id} ---")
+
+    chat_history_for_chain = to_langchain_messages(db_messages)
+    if summary:
+        chat_history_for_chain.insert(
+            0, SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")
+        )
+    return chat_history_for_chain
+
+
+@router.post("/", summary="Post a new message and get a streaming response")
+async def post_new_message(
+    *,
+    request_data: NewChatMessageRequest,
+    async_db_session: AsyncSession = Depends(get_async_write_session),
+    current_user: User = Depends(get_current_active_user),
+):
+    user_id = current_user.id
+    await limiter.enforce(f"chat:{user_id}", settings.chat_rate_limit)
+    model_rate_limit = get_model_rate_limit(request_data.model_name)
+    if model_rate_limit:
+        await limiter.enforce(f"chat:{user_id}:{request_data.model_name}", model_rate_limit)
+
+    chat_session_id, has_documents, session_was_created, user_message_id = await _prepare_chat_session(
+        async_db_session, request_data, user_id
     )
-    db_messages = db_session.exec(statement).all()
-    print(f"--- DEBUG: Fetched {len(db_messages)} messages from DB for session {chat_session.id} ---")
-
-    # Format history for LangChain (excluding the current user message)
-    chat_history_for_chain = []
-    for msg in db_messages[:-1]:
-        if msg.role == "user":
-            chat_history_for_chain.append(HumanMessage(content=msg.content))
-        elif msg.role == "model":
-            chat_history_for_chain.append(AIMessage(content=msg.content))
-    
-    print(f"--- DEBUG: Formatted {len(chat_history_for_chain)} messages for LangChain ---")
-    print(request_data.prompt, 
-            chat_session.id, 
-            chat_history_for_chain, 
-            db_session
+
+    server_timing = None
+    if settings.async_streaming:
+        # History, web search and retrieval run concurrently before the first token
+        context = await prepare_generation_context(
+            request_data.prompt,
+            chat_session_id,
+            has_documents,
+            request_data.use_web_search,
+            load_history=lambda: run_in_threadpool(
+                _load_chat_history, chat_session_id, request_data.model_name, user_message_id
+            )
         )
-    # *** CHANGE: Create StreamingResponse with custom headers that include session ID ***
-    response = StreamingResponse(
-        stream_and_save_response_with_headers(
+        server_timing = context.server_timing()
+        response_stream = astream_and_save_response_with_headers(
+            request_data.prompt,
+            chat_session_id,
+            context.chat_history,
+            has_documents,
+            user_id,
+            request_data.model_name,
+            request_data.use_web_search,
+            context
+        )
+    else:
+        chat_history_for_chain = await run_in_threadpool(
+            _load_chat_history, chat_session_id, request_data.model_name, user_message_id
+        )
+        response_stream = stream_and_save_response_with_headers(
             request_data.prompt, 
-            chat_session.id, 
+            chat_session_id, 
             chat_history_for_chain, 
-            db_session,
+            has_documents,
+            user_id,
             request_data.model_name,
             request_data.use_web_search
-        ),
+        )
+    response = StreamingResponse(
+        response_stream,
         media_type="text/plain; charset=utf-8"
     )
     
     # *** CHANGE: Add session ID to response headers so frontend can capture it ***
-    response.headers["X-Session-ID"] = str(chat_session.id)
+    response.headers["X-Session-ID"] = str(chat_session_id)
     # *** CHANGE: Add flag to indicate if this was a new session ***
     response.headers["X-Session-Created"] = str(session_was_created).lower()
+    if server_timing:
+        # Per-stage pre-generation timings, visible in the browser's network panel
+        response.headers["Server-Timing"] = server_timing
     
-    print(f"--- DEBUG: Returning response with session ID {chat_session.id} in headers ---")
+    print(f"--- DEBUG: Returning response with session ID {chat_session_id} in headers ---")
     return response
 
 # --- Other Endpoints (No changes) ---
@@ -324,31 +465,124 @@ def get_available_models():
     return models_by_provider
 
 
-@router.get("/", response_model=List[ChatSessionResponse], summary="Get all chat sessions for the current user")
-def get_user_chat_sessions(
+@router.get("/models/stats", summary="Get LLM client pool statistics")
+def get_model_pool_stats(admin_user: User = Depends(require_admin)):
+    """Per-model cache hits/misses and client construction times"""
+    return model_registry.get_stats()
+
+
+@router.post("/models/evict", summary="Evict a pooled LLM client")
+def evict_model_client(model_name: str, admin_user: User = Depends(require_admin)):
+    try:
+        evicted = evict_model_instance(model_name)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return {"model_name": model_name, "evicted": evicted}
+
+
+@router.post("/models/reload", summary="Rebuild a pooled LLM client")
+def reload_model_client(model_name: str, admin_user: User = Depends(require_admin)):
+    try:
+        reload_model_instance(model_name)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return {"model_name": model_name, "reloaded": True}
+
+
+def _encode_session_cursor(last_activity_at: datetime, session_id: int) -> str:
+    raw = f"{last_activity_at.isoformat()}|{session_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_session_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        last_activity_at, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(last_activity_at), int(session_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+@router.get("/", response_model=ChatSessionPage, summary="Get the current user's chat sessions, most recently active first")
+async def get_user_chat_sessions(
     *, 
-    session: Session = Depends(get_session), 
+    limit: int = Query(default=30, ge=1, le=100, description="Maximum number of sessions to return"),
+    cursor: Optional[str] = Query(default=None, description="next_cursor from the previous page"),
+    session: AsyncSession = Depends(get_async_session), 
     current_user: User = Depends(get_current_active_user)
 ):
-    return current_user.sessions
+    keyset = _decode_session_cursor(cursor) if cursor else None
+    rows = list((await session.exec(session_page_statement(current_user.id, limit + 1, keyset))).all())
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_session_cursor(rows[-1].last_activity_at, rows[-1].id)
+    return ChatSessionPage(
+        sessions=[ChatSessionListItem(id=row.id, title=row.title, last_activity_at=row.last_activity_at) for row in rows],
+        next_cursor=next_cursor
+    )
 
 @router.get("/{session_id}", response_model=ChatHistoryResponse, summary="Get the history of a specific chat session")
-def get_chat_history(
+async def get_chat_history(
     *, 
     session_id: int, 
-    session: Session = Depends(get_session), 
+    limit: int = Query(default=50, ge=1, le=200, description="Maximum number of messages to return"),
+    before: Optional[int] = Query(default=None, description="Return messages older than this message id"),
+    after: Optional[int] = Query(default=None, description="Return messages newer than this message id"),
+    session: AsyncSession = Depends(get_async_session), 
     current_user: User = Depends(get_current_active_user)
 ):
-    chat_session = session.get(ChatSession, session_id)
-    if not chat_session or chat_session.user_id != current_user.id:
+    """
+    Returns one page of a session's messages in chronological order. Without a
+    cursor this is the latest page; `before` pages back through older messages
+    and `after` forward through newer ones.
+    """
+    if before is not None and after is not None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Use either 'before' or 'after', not both")
+
+    chat_session = (await session.exec(
+        select(ChatSession.id, ChatSession.title)
+        .where(ChatSession.id == session_id, ChatSession.user_id == current_user.id)
+    )).first()
+    if not chat_session:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat session not found")
-    return chat_session
+
+    cursor = None
+    cursor_id = before if before is not None else after
+    if cursor_id is not None:
+        cursor = (await session.exec(
+            select(ChatMessage.created_at, ChatMessage.id)
+            .where(ChatMessage.id == cursor_id, ChatMessage.session_id == session_id)
+        )).first()
+        if not cursor:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor message not found in this session")
+
+    # One extra row tells us whether another page exists without a COUNT query
+    statement = message_page_statement(
+        session_id,
+        limit + 1,
+        before=tuple(cursor) if cursor and after is None else None,
+        after=tuple(cursor) if cursor and after is not None else None,
+        columns=(ChatMessage.id, ChatMessage.content, ChatMessage.role)
+    )
+    rows = list((await session.exec(statement)).all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is None:
+        rows.reverse()
+
+    return ChatHistoryResponse(
+        id=chat_session.id,
+        title=chat_session.title,
+        messages=[ChatMessageResponse(id=row.id, content=row.content, role=row.role) for row in rows],
+        has_more=has_more
+    )
 
 @router.put("/{session_id}", response_model=ChatSessionResponse, summary="Rename a chat session")
 def rename_chat_session(
     session_id: int,
     request_data: RenameChatRequest,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_write_session),
     current_user: User = Depends(get_current_active_user)
 ):
     chat_session = session.get(ChatSession, session_id)
@@ -366,7 +600,7 @@ def rename_chat_session(
 @router.delete("/all", status_code=status.HTTP_200_OK, summary="Delete all chat sessions for current user")
 def delete_all_chat_sessions(
     *,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_write_session),
     current_user: User = Depends(get_current_active_user)
 ):
     # Get all chat sessions for the current user
@@ -390,7 +624,7 @@ def delete_all_chat_sessions(
 def delete_chat_session(
     *,
     session_id: int,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_write_session),
     current_user: User = Depends(get_current_active_user)
 ):
     chat_session = session.get(ChatSession, session_id)
@@ -491,6 +725,16 @@ async def get_usage_totals(
         raise HTTPException(status_code=500, detail="Failed to retrieve usage totals")
 
 
+@router.post("/usage/totals/repair", summary="Rebuild lifetime usage totals from daily data (admin only)")
+def repair_usage_totals(
+    fix: bool = True,
+    admin_user: User = Depends(require_admin)
+):
+    """Recomputes user_usage_totals from the daily tables and reports users whose totals had drifted"""
+    drift = UsageTracker.repair_user_totals(fix=fix)
+    return {"drifted_users": len(drift), "fixed": fix, "drift": drift}
+
+
 # Usage Statistics Endpoints
 @router.get("/usage/stats")
 async def get_usage_stats(
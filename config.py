@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -17,6 +18,85 @@ class Settings(BaseSettings):
     mail_server: str
     mail_starttls: bool
     mail_ssl_tls: bool
+    # Stream chat replies with the async (astream) pipeline; False falls back to the sync generator
+    async_streaming: bool = True
+    # Content-addressed embedding cache (in-memory LRU in front of a SQLite file)
+    embedding_cache_path: str = "./embedding_cache.db"
+    embedding_cache_memory_entries: int = 10000
+    embedding_cache_max_disk_entries: int = 200000
+    # Background document ingestion
+    ingestion_workers: int = 2
+    ingestion_max_pending: int = 20
+    # Minimum gap between progress writes to a job's row
+    ingestion_progress_interval_seconds: float = 1.0
+    # How long shutdown waits for running jobs to stop before closing the stores
+    ingestion_shutdown_timeout_seconds: float = 30.0
+    # Chunk embedding during ingestion: batch size, batches in flight, retries per batch
+    embedding_batch_size: int = 100
+    embedding_concurrency: int = 4
+    embedding_max_retries: int = 3
+    embedding_retry_base_delay: float = 1.0
+    # Upper bound on embedded-but-unstored batches; keeps ingestion memory flat for large files
+    embedding_max_in_flight_batches: int = 8
+    # Per-session BM25 index used for hybrid retrieval
+    lexical_index_path: str = "./lexical_index.db"
+    # Per-session retrieval results, invalidated whenever the session gets new chunks
+    retrieval_cache_max_entries: int = 1024
+    # Tavily web search: request timeout (seconds), keep-alive pool size and result cache
+    web_search_timeout: float = 10.0
+    web_search_pool_size: int = 10
+    web_search_cache_ttl_seconds: int = 600
+    web_search_cache_max_entries: int = 512
+    # Per-stage deadlines (seconds) for the work done before the first token.
+    # Web search and history are optional: generation continues without them if they miss.
+    web_search_deadline_seconds: float = 3.0
+    history_deadline_seconds: float = 2.0
+    query_embedding_deadline_seconds: float = 5.0
+    vector_search_deadline_seconds: float = 3.0
+    # Directory holding tiktoken BPE files, for deployments without network access at runtime
+    tiktoken_cache_dir: Optional[str] = None
+    # Chat history window: token budget for models without their own, keyset page size and hard cap
+    history_token_budget: int = 6000
+    history_page_size: int = 20
+    history_max_messages: int = 200
+    # Rolling conversation summary for turns older than the history window
+    summary_model_name: str = "gemini-1.5-flash"
+    summary_max_words: int = 250
+    summary_max_messages_per_update: int = 40
+    # Usage counters are buffered in memory and flushed in the background
+    usage_flush_interval_seconds: float = 5.0
+    usage_flush_max_pending: int = 1000
+    # Database: SQL echo is for local debugging only; pool settings apply to both engines
+    database_echo: bool = False
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    # Defaults to database_url with its async driver (aiosqlite / asyncpg)
+    async_database_url: Optional[str] = None
+    # SQLite production profile: WAL plus connection pragmas and one serialized writer connection
+    sqlite_tuning: bool = True
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_cache_size_kib: int = 65536
+    sqlite_mmap_size_bytes: int = 268435456
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_writer_pool_timeout: float = 30.0
+    # Authenticated users cached per token; changes to a user invalidate it, the TTL bounds staleness across workers
+    auth_user_cache_ttl_seconds: float = 30.0
+    auth_user_cache_max_entries: int = 10000
+    # bcrypt cost for new hashes; older hashes are upgraded on the next successful login
+    bcrypt_rounds: int = 12
+    # Dedicated password hashing pool: concurrent hashes and how many may wait before requests get a 503
+    password_hash_workers: int = 2
+    password_hash_max_queue: int = 64
+    # Token-bucket rate limits ("N/second|minute|hour|day"), shared by all workers through the backend:
+    # "sqlite" (a local file, one host) or "redis" (any Redis-protocol server, needs the redis package)
+    rate_limit_enabled: bool = True
+    rate_limit_backend: str = "sqlite"
+    rate_limit_sqlite_path: str = "./rate_limits.db"
+    rate_limit_redis_url: str = "redis://localhost:6379/0"
+    chat_rate_limit: str = "30/minute"
+    # Per user and model, for models without their own "rate_limit" entry; None means no extra limit
+    chat_model_rate_limit: Optional[str] = None
+    login_rate_limit: str = "5/minute"
     model_config = SettingsConfigDict(env_file = ".env")
 
 settings = Settings()
\ No newline at end of file
@@ -1,5 +1,9 @@
 from models import User
 from sqlmodel import SQLModel,create_engine,Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from pathlib import Path
 from config import settings
 # from sqlalchemy.orm import sessionmaker
@@ -7,11 +11,121 @@ from config import settings
 
 BASE_DIR = Path(__file__).resolve().parent
 
-engine = create_engine(settings.database_url,echo= True,connect_args={"check_same_thread":False})
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+
+def _engine_kwargs(url: str) -> dict:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        kwargs = {"connect_args": {"check_same_thread": False}}
+        # In-memory databases live on a single connection; there is no pool to size
+        if parsed.database and parsed.database != ":memory:":
+            kwargs.update(pool_size=settings.database_pool_size, max_overflow=settings.database_max_overflow)
+        return kwargs
+    return {
+        "pool_size": settings.database_pool_size,
+        "max_overflow": settings.database_max_overflow,
+        "pool_pre_ping": True,
+    }
+
+
+def _async_url(url: str) -> str:
+    parsed = make_url(url)
+    # Keep an explicitly chosen async driver; otherwise use the default one for the backend
+    if parsed.drivername not in ASYNC_DRIVERS and parsed.drivername not in ("sqlite+pysqlite", "postgresql+psycopg2"):
+        return url
+    drivername = ASYNC_DRIVERS[parsed.get_backend_name()]
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def _is_sqlite_file(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and bool(parsed.database) and parsed.database != ":memory:"
+
+
+def apply_sqlite_profile(sync_engine, writer: bool = False):
+    """
+    Sets the SQLite tuning pragmas on every new connection. WAL lets readers run
+    alongside the writer instead of queueing behind its lock.
+
+    Writer engines also open every transaction with BEGIN IMMEDIATE, so the write
+    lock is taken (or waited for, up to busy_timeout) up front rather than failing
+    with "database is locked" when a read transaction later tries to write.
+    """
+    @event.listens_for(sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA cache_size=-{settings.sqlite_cache_size_kib}")
+        cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size_bytes}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+        if writer:
+            # Let SQLAlchemy's begin event issue BEGIN instead of the driver
+            dbapi_connection.isolation_level = None
+
+    if writer:
+        @event.listens_for(sync_engine, "begin")
+        def _begin_immediate(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _writer_kwargs(url: str) -> dict:
+    kwargs = _engine_kwargs(url)
+    kwargs.update(pool_size=1, max_overflow=0, pool_timeout=settings.sqlite_writer_pool_timeout)
+    return kwargs
+
+
+engine = create_engine(settings.database_url, echo=settings.database_echo, **_engine_kwargs(settings.database_url))
+
+# Request-path engine: queries are awaited instead of blocking the event loop
+async_database_url = settings.async_database_url or _async_url(settings.database_url)
+async_engine = create_async_engine(async_database_url, echo=settings.database_echo, **_engine_kwargs(async_database_url))
+
+# SQLite allows one writer at a time. Every write goes through a writer engine: one pooled
+# connection for sync code (write_engine) and one for async code (async_write_engine), so each
+# process has two writer connections. Writes on the same engine queue in its pool; the two
+# engines, and other processes, serialize on the file lock, which every write transaction takes
+# up front with BEGIN IMMEDIATE. Other backends write through the regular engines.
+if settings.sqlite_tuning and _is_sqlite_file(settings.database_url):
+    write_engine = create_engine(settings.database_url, echo=settings.database_echo, **_writer_kwargs(settings.database_url))
+    async_write_engine = create_async_engine(async_database_url, echo=settings.database_echo, **_writer_kwargs(async_database_url))
+    apply_sqlite_profile(engine)
+    apply_sqlite_profile(async_engine.sync_engine)
+    apply_sqlite_profile(write_engine, writer=True)
+    apply_sqlite_profile(async_write_engine.sync_engine, writer=True)
+else:
+    write_engine = engine
+    async_write_engine = async_engine
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
 
 def get_session():
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+def get_write_session():
+    # The first statement takes the write lock; keep slow work out of handlers that use this
+    with Session(write_engine) as session:
+        yield session
+
+async def get_async_session():
+    # expire_on_commit=False so returned objects stay readable after commit without another round trip
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+async def get_async_write_session():
+    async with AsyncSession(async_write_engine, expire_on_commit=False) as session:
+        yield session
+
+async def close_async_engine():
+    await async_engine.dispose()
+    if async_write_engine is not async_engine:
+        await async_write_engine.dispose()
@@ -3,8 +3,10 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlmodel import Session,select
-from database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import async_engine
 from models import User, Role
+from user_cache import auth_user_cache
 from config import settings
 
 
@@ -17,7 +19,16 @@ def get_user(session: Session, username: str) -> User | None:
     return user
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)) -> User:
+async def aget_user(session: AsyncSession, username: str) -> User | None:
+    statement = select(User).where(User.username == username)
+    user = (await session.exec(statement)).first()
+    if user is not None:
+        # Detach so handlers can use the user with their own (sync) sessions
+        session.expunge(user)
+    return user
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -32,9 +43,19 @@ async def get_current_user(token: str = Depends(oauth2_scheme), session: Session
     except JWTError:
         raise credentials_exception
 
-    user = get_user(session, username=username)
+    # Tokens issued before iat was added are told apart by their expiry instead
+    issued_at = payload.get("iat", payload.get("exp"))
+    user = auth_user_cache.get(username, issued_at)
+    if user is not None:
+        return user
+
+    version = auth_user_cache.get_version(username)
+    # Only a cache miss opens a database session
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        user = await aget_user(session, username=username)
     if user is None:
         raise credentials_exception
+    auth_user_cache.put(username, issued_at, version, user)
     return user
 
 
@@ -0,0 +1,194 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from config import settings
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes text so trivially different inputs share one cache entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def make_cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier, content-addressed embedding cache.
+
+    An in-memory LRU sits in front of a SQLite file. The disk tier is bounded by
+    entry count and evicts the least recently used rows once it grows past the limit.
+    """
+
+    def __init__(self, path: str, max_memory_entries: int = 10000, max_disk_entries: int = 200000):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_count = 0
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stored": 0,
+            "disk_evictions": 0,
+        }
+
+    def _get_conn(self) -> sqlite3.Connection:
+        # Caller must hold self._lock
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+            self._conn.commit()
+            self._disk_count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return self._conn
+
+    def _remember(self, key: str, vector: List[float]):
+        # Caller must hold self._lock
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Returns the cached vectors for whichever keys are present."""
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    self._stats["memory_hits"] += 1
+                else:
+                    missing.append(key)
+
+            if missing:
+                conn = self._get_conn()
+                unique_missing = list(dict.fromkeys(missing))
+                for start in range(0, len(unique_missing), 500):
+                    batch = unique_missing[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = array("f", blob).tolist()
+                        found[key] = vector
+                        self._remember(key, vector)
+                    if rows:
+                        now = time.time()
+                        conn.executemany(
+                            "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                            [(now, key) for key, _ in rows]
+                        )
+                conn.commit()
+                for key in missing:
+                    if key in found:
+                        self._stats["disk_hits"] += 1
+                    else:
+                        self._stats["misses"] += 1
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        with self._lock:
+            conn = self._get_conn()
+            now = time.time()
+            inserted = 0
+            for key, vector in items.items():
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                    (key, array("f", vector).tobytes(), now)
+                )
+                inserted += cursor.rowcount
+                self._remember(key, vector)
+            self._disk_count += inserted
+            self._stats["stored"] += inserted
+
+            overflow = self._disk_count - self.max_disk_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,)
+                )
+                self._disk_count -= overflow
+                self._stats["disk_evictions"] += overflow
+            conn.commit()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = self._disk_count
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._memory.clear()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses to the underlying provider."""
+
+    def __init__(self, underlying: Embeddings, model_name: str, cache: EmbeddingCache):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [make_cache_key(self.model_name, text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        # Embed each distinct missing text once, even if it repeats in this batch
+        to_embed: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in to_embed:
+                to_embed[key] = text
+
+        if to_embed:
+            vectors = self.underlying.embed_documents(list(to_embed.values()))
+            new_items = dict(zip(to_embed.keys(), vectors))
+            self.cache.put_many(new_items)
+            cached.update(new_items)
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        # Queries are keyed separately: some providers embed queries with a different task type
+        key = make_cache_key(f"{self.model_name}:query", text)
+        cached = self.cache.get_many([key])
+        if key in cached:
+            return cached[key]
+
+        vector = self.underlying.embed_query(text)
+        self.cache.put_many({key: vector})
+        return vector
+
+
+embedding_cache = EmbeddingCache(
+    settings.embedding_cache_path,
+    max_memory_entries=settings.embedding_cache_memory_entries,
+    max_disk_entries=settings.embedding_cache_max_disk_entries,
+)
@@ -0,0 +1,155 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlmodel import Session, select
+from sqlalchemy import and_, or_
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+from models import ChatSession, ChatMessage
+from token_counter import TOKENS_PER_MESSAGE, count_tokens
+from config import settings
+
+
+def history_page_statement(
+    chat_session_id: int,
+    page_size: int,
+    cursor: Optional[Tuple[datetime, int]] = None,
+    after_message_id: Optional[int] = None
+):
+    """One newest-first keyset page, served by ix_chat_messages_session_id_created_at_id."""
+    statement = select(ChatMessage).where(ChatMessage.session_id == chat_session_id)
+    if after_message_id is not None:
+        statement = statement.where(ChatMessage.id > after_message_id)
+    if cursor is not None:
+        created_at, message_id = cursor
+        statement = statement.where(
+            or_(
+                ChatMessage.created_at < created_at,
+                and_(ChatMessage.created_at == created_at, ChatMessage.id < message_id)
+            )
+        )
+    return statement.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(page_size)
+
+
+def message_page_statement(
+    chat_session_id: int,
+    limit: int,
+    before: Optional[Tuple[datetime, int]] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+    columns=None
+):
+    """
+    One keyset page of a session's messages for the history endpoint. Pages
+    before a cursor (or the latest page) are read newest first; pages after a
+    cursor oldest first. Selecting only `columns` keeps the read on the
+    (session_id, created_at, id) index plus the row fetch for those fields.
+    """
+    statement = select(*(columns or (ChatMessage,))).where(ChatMessage.session_id == chat_session_id)
+    if before is not None:
+        created_at, message_id = before
+        statement = statement.where(
+            or_(
+                ChatMessage.created_at < created_at,
+                and_(ChatMessage.created_at == created_at, ChatMessage.id < message_id)
+            )
+        )
+    if after is not None:
+        created_at, message_id = after
+        statement = statement.where(
+            or_(
+                ChatMessage.created_at > created_at,
+                and_(ChatMessage.created_at == created_at, ChatMessage.id > message_id)
+            )
+        )
+        return statement.order_by(ChatMessage.created_at, ChatMessage.id).limit(limit)
+    return statement.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(limit)
+
+
+def session_page_statement(
+    user_id: int,
+    limit: int,
+    cursor: Optional[Tuple[datetime, int]] = None
+):
+    """
+    One page of a user's sessions, most recently active first, projected to
+    (id, title, last_activity_at) and served by
+    ix_chat_sessions_user_id_last_activity_at_id. `cursor` is the
+    (last_activity_at, id) of the last session on the previous page.
+    """
+    statement = (
+        select(ChatSession.id, ChatSession.title, ChatSession.last_activity_at)
+        .where(ChatSession.user_id == user_id)
+    )
+    if cursor is not None:
+        last_activity_at, session_id = cursor
+        statement = statement.where(
+            or_(
+                ChatSession.last_activity_at < last_activity_at,
+                and_(ChatSession.last_activity_at == last_activity_at, ChatSession.id < session_id)
+            )
+        )
+    return statement.order_by(ChatSession.last_activity_at.desc(), ChatSession.id.desc()).limit(limit)
+
+
+def load_history_window(
+    db_session: Session,
+    chat_session_id: int,
+    token_budget: int,
+    before_message_id: Optional[int] = None,
+    after_message_id: Optional[int] = None,
+    page_size: Optional[int] = None,
+    max_messages: Optional[int] = None,
+    provider: Optional[str] = None
+) -> List[ChatMessage]:
+    """
+    Returns the most recent messages of a session that fit in `token_budget`,
+    in chronological order.
+
+    Messages are read newest first in keyset pages on (created_at, id), so the
+    cost is proportional to the window, not to the length of the session.
+    `before_message_id` excludes that message and everything after it (the
+    prompt currently being answered); `after_message_id` stops the window at
+    messages already folded into the session's rolling summary.
+    Messages are measured with `provider`'s tokenizer, as the model will count them.
+    """
+    page_size = page_size or settings.history_page_size
+    max_messages = max_messages or settings.history_max_messages
+
+    cursor = None
+    if before_message_id is not None:
+        anchor = db_session.get(ChatMessage, before_message_id)
+        if anchor is not None:
+            cursor = (anchor.created_at, anchor.id)
+
+    window: List[ChatMessage] = []
+    used_tokens = 0
+    while len(window) < max_messages:
+        statement = history_page_statement(chat_session_id, page_size, cursor, after_message_id)
+        page = db_session.exec(statement).all()
+
+        for message in page:
+            cost = count_tokens(message.content, provider) + TOKENS_PER_MESSAGE
+            if used_tokens + cost > token_budget or len(window) >= max_messages:
+                page = None
+                break
+            window.append(message)
+            used_tokens += cost
+
+        if not page or len(page) < page_size:
+            break
+        cursor = (page[-1].created_at, page[-1].id)
+
+    window.reverse()
+    # Don't open the window with a dangling model reply whose prompt fell outside the budget
+    while window and window[0].role != "user":
+        window.pop(0)
+    return window
+
+
+def to_langchain_messages(messages: List[ChatMessage]) -> List[BaseMessage]:
+    """Formats stored chat messages for LangChain."""
+    history: List[BaseMessage] = []
+    for msg in messages:
+        if msg.role == "user":
+            history.append(HumanMessage(content=msg.content))
+        elif msg.role == "model":
+            history.append(AIMessage(content=msg.content))
+    return history
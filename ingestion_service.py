@@ -0,0 +1,219 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, UTC
+from typing import Dict, Optional
+from sqlalchemy import delete, update
+from sqlmodel import Session
+from database import engine, write_engine
+from models import ChatSession, IngestionJob
+from rag_service import IngestionStopped, process_and_store_document
+from config import settings
+
+SHUTDOWN_ERROR = "The server shut down before this document was processed; please upload it again"
+
+
+class IngestionQueueFull(Exception):
+    pass
+
+
+def _write_job(job_id: str, **fields):
+    with Session(write_engine) as db:
+        db.exec(update(IngestionJob).where(IngestionJob.id == job_id).values(**fields))
+        db.commit()
+
+
+class _RunningJob:
+    """
+    This worker's handle on a queued or running job. Clients read the job's row,
+    so progress counters are written there at most every `progress_interval`
+    seconds; status changes are written straight away.
+    """
+
+    def __init__(self, job_id: str, session_id: int, file_path: str, progress_interval: float):
+        self.id = job_id
+        self.session_id = session_id
+        self.file_path = file_path
+        self.progress_interval = progress_interval
+        self.future: Optional[Future] = None
+        self._pending: Dict = {}
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, **counters):
+        """Progress callback passed to the ingestion pipeline."""
+        with self._lock:
+            self._pending.update(counters)
+            if time.monotonic() - self._last_write < self.progress_interval:
+                return
+            counters, self._pending = self._pending, {}
+            self._last_write = time.monotonic()
+        try:
+            _write_job(self.id, **counters)
+        except Exception as e:
+            # Progress is informational; a failed write must not fail the ingestion
+            print(f"--- ERROR: Could not record progress for ingestion job {self.id}: {e} ---")
+
+    def save(self, **fields):
+        """Writes `fields` together with any progress not written yet."""
+        with self._lock:
+            fields, self._pending = {**self._pending, **fields}, {}
+            self._last_write = time.monotonic()
+        _write_job(self.id, **fields)
+
+
+class IngestionQueue:
+    """
+    Bounded worker pool for document ingestion. Uploads are queued and processed
+    off the request path; the upload endpoint only returns a job id.
+
+    Job state lives in the ingestion_jobs table, so any worker can answer a
+    status poll. The queue bound applies to this worker's own pool.
+
+    On shutdown, queued jobs are cancelled and running ones are asked to stop
+    after their current batch, with a bounded wait; either way the job is marked
+    failed and its upload removed before the stores it writes to are closed.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        max_pending: int,
+        job_retention_minutes: int = 60,
+        progress_interval: float = 1.0,
+        shutdown_timeout: float = 30.0
+    ):
+        self.max_pending = max_pending
+        self.shutdown_timeout = shutdown_timeout
+        self._stopping = threading.Event()
+        self.job_retention = timedelta(minutes=job_retention_minutes)
+        self.progress_interval = progress_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingestion")
+        self._active: Dict[str, _RunningJob] = {}
+        self._lock = threading.Lock()
+
+    def _prune_finished_jobs(self, db: Session):
+        cutoff = datetime.now(UTC) - self.job_retention
+        db.exec(delete(IngestionJob).where(IngestionJob.finished_at < cutoff))
+
+    def submit(self, session_id: int, user_id: int, filename: str, file_path: str) -> IngestionJob:
+        job = IngestionJob(session_id=session_id, user_id=user_id, filename=filename)
+        handle = _RunningJob(job.id, session_id, file_path, self.progress_interval)
+        with self._lock:
+            pending = len(self._active)
+            if pending >= self.max_pending:
+                raise IngestionQueueFull(f"Too many documents are being processed ({pending}). Try again shortly.")
+            self._active[job.id] = handle
+
+        try:
+            with Session(write_engine) as db:
+                self._prune_finished_jobs(db)
+                db.add(job)
+                db.commit()
+                db.refresh(job)
+        except Exception:
+            with self._lock:
+                del self._active[job.id]
+            raise
+
+        handle.future = self._executor.submit(self._run, handle)
+        print(f"--- INFO: Queued ingestion job {job.id} for {filename} (session {session_id}) ---")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with Session(engine) as db:
+            return db.get(IngestionJob, job_id)
+
+    def _run(self, job: _RunningJob):
+        try:
+            job.save(status="running", started_at=datetime.now(UTC))
+            result = process_and_store_document(
+                job.file_path, job.session_id, progress=job.update, should_stop=self._stopping.is_set
+            )
+
+            # The session only switches to RAG once the job has stored its chunks
+            with Session(write_engine) as db:
+                chat_session = db.get(ChatSession, job.session_id)
+                if chat_session and not chat_session.has_documents:
+                    chat_session.has_documents = True
+                    db.add(chat_session)
+                    db.commit()
+                    print(f"--- DEBUG: Updated chat session {job.session_id} to have documents ---")
+
+            if result["chunks_failed"]:
+                job.save(
+                    status="partial",
+                    error=f"{result['chunks_failed']} chunks could not be embedded",
+                    chunks_failed=result["chunks_failed"],
+                    finished_at=datetime.now(UTC)
+                )
+            else:
+                job.save(status="completed", finished_at=datetime.now(UTC))
+            print(f"--- INFO: Ingestion job {job.id} completed ---")
+        except IngestionStopped as e:
+            print(f"--- INFO: Ingestion job {job.id} stopped for shutdown: {e} ---")
+            self._mark_failed(job, SHUTDOWN_ERROR)
+        except Exception as e:
+            print(f"--- ERROR: Ingestion job {job.id} failed: {e} ---")
+            self._mark_failed(job, str(e))
+        finally:
+            self._discard(job)
+
+    def _mark_failed(self, job: _RunningJob, error: str):
+        try:
+            job.save(status="failed", error=error, finished_at=datetime.now(UTC))
+        except Exception as e:
+            print(f"--- ERROR: Could not record failure of ingestion job {job.id}: {e} ---")
+
+    def _discard(self, job: _RunningJob):
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        with self._lock:
+            self._active.pop(job.id, None)
+
+    def fail_interrupted_jobs(self):
+        """
+        Marks jobs left queued or running by a previous process as failed. Called at
+        startup, before this process has queued anything. Their uploads were in the
+        previous process's temp files, so the user has to upload again. If a sibling
+        worker is still running one of them, its final status overwrites this one.
+        """
+        with Session(write_engine) as db:
+            result = db.exec(
+                update(IngestionJob)
+                .where(IngestionJob.status.in_(("queued", "running")))
+                .values(status="failed", error=SHUTDOWN_ERROR, finished_at=datetime.now(UTC))
+            )
+            db.commit()
+        if result.rowcount:
+            print(f"--- INFO: Marked {result.rowcount} interrupted ingestion jobs as failed ---")
+
+    def shutdown(self):
+        self._stopping.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        # Queued jobs were cancelled and will never run; fail them and remove their uploads
+        with self._lock:
+            cancelled = [job for job in self._active.values() if job.future and job.future.cancelled()]
+            running = [job for job in self._active.values() if job.future and not job.future.cancelled()]
+        for job in cancelled:
+            self._mark_failed(job, SHUTDOWN_ERROR)
+            self._discard(job)
+        if cancelled:
+            print(f"--- INFO: Cancelled {len(cancelled)} queued ingestion jobs on shutdown ---")
+
+        # Running jobs stop after their current batch; don't let the stores close underneath them
+        _, still_running = wait([job.future for job in running], timeout=self.shutdown_timeout)
+        for job in running:
+            if job.future in still_running:
+                print(f"--- ERROR: Ingestion job {job.id} did not stop within {self.shutdown_timeout}s ---")
+                self._mark_failed(job, SHUTDOWN_ERROR)
+                self._discard(job)
+
+
+ingestion_queue = IngestionQueue(
+    max_workers=settings.ingestion_workers,
+    max_pending=settings.ingestion_max_pending,
+    progress_interval=settings.ingestion_progress_interval_seconds,
+    shutdown_timeout=settings.ingestion_shutdown_timeout_seconds,
+)
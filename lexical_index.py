@@ -0,0 +1,231 @@
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+from config import settings
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were what when where "
+    "which who why will with how do does did can i you we they he she me my our your".split()
+)
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercases and tokenizes text. Compound tokens such as part numbers ("XK-0042")
+    are kept whole and also indexed by their parts so both forms match.
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.findall(text.lower()):
+        if match not in STOPWORDS:
+            tokens.append(match)
+        if not match.isalnum():
+            tokens.extend(part for part in re.split(r"[-_./]", match) if part and part not in STOPWORDS)
+    return tokens
+
+
+class _SessionIndex:
+    def __init__(self, version: int = 0):
+        self.version = version
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def add(self, chunk_id: str, term_counts: Counter):
+        length = sum(term_counts.values())
+        self.lengths[chunk_id] = length
+        self.total_length += length
+        for term, tf in term_counts.items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+
+
+class LexicalIndex:
+    """
+    Per-session BM25 inverted index kept next to the Chroma collection.
+
+    Postings are persisted in a SQLite file and updated incrementally on every
+    upload; searches run against an in-memory copy of the session's index that
+    is loaded on first use and kept in a small LRU.
+
+    Every upload also bumps the session's version in the same file and
+    transaction. A cached copy is only used while its version matches the
+    stored one, so chunks indexed by another worker are picked up on the next
+    search, and the retrieval cache keys its entries on the same version.
+    """
+
+    def __init__(self, path: str, max_cached_sessions: int = 256):
+        self.path = path
+        self.max_cached_sessions = max_cached_sessions
+        self._sessions: "OrderedDict[str, _SessionIndex]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _get_conn(self) -> sqlite3.Connection:
+        # Caller must hold self._lock
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS lexical_chunks (
+                    chunk_id TEXT PRIMARY KEY,
+                    session_id TEXT NOT NULL,
+                    length INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_lexical_chunks_session ON lexical_chunks (session_id);
+                CREATE TABLE IF NOT EXISTS lexical_postings (
+                    session_id TEXT NOT NULL,
+                    term TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    tf INTEGER NOT NULL,
+                    PRIMARY KEY (session_id, term, chunk_id)
+                );
+                CREATE TABLE IF NOT EXISTS lexical_sessions (
+                    session_id TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                );
+                """
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _read_version(self, session_id: str) -> int:
+        # Caller must hold self._lock
+        row = self._get_conn().execute(
+            "SELECT version FROM lexical_sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_version(self, session_id) -> int:
+        """The session's stored version; it changes whenever any worker indexes new chunks for it."""
+        with self._lock:
+            return self._read_version(str(session_id))
+
+    def _load_session(self, session_id: str) -> _SessionIndex:
+        # Caller must hold self._lock
+        version = self._read_version(session_id)
+        index = self._sessions.get(session_id)
+        if index is not None and index.version == version:
+            self._sessions.move_to_end(session_id)
+            return index
+
+        conn = self._get_conn()
+        # One read transaction, so the version matches the postings loaded with it
+        conn.execute("BEGIN")
+        try:
+            version = self._read_version(session_id)
+            index = _SessionIndex(version)
+            for chunk_id, length in conn.execute(
+                "SELECT chunk_id, length FROM lexical_chunks WHERE session_id = ?", (session_id,)
+            ):
+                index.lengths[chunk_id] = length
+                index.total_length += length
+            for term, chunk_id, tf in conn.execute(
+                "SELECT term, chunk_id, tf FROM lexical_postings WHERE session_id = ?", (session_id,)
+            ):
+                index.postings.setdefault(term, {})[chunk_id] = tf
+        finally:
+            conn.commit()
+
+        self._sessions[session_id] = index
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_cached_sessions:
+            self._sessions.popitem(last=False)
+        return index
+
+    def has_session(self, session_id) -> bool:
+        with self._lock:
+            # Always asks the file; a cached copy may predate another worker's upload
+            row = self._get_conn().execute(
+                "SELECT 1 FROM lexical_chunks WHERE session_id = ? LIMIT 1", (str(session_id),)
+            ).fetchone()
+            return row is not None
+
+    def add_chunks(self, session_id, chunk_ids: List[str], texts: List[str]):
+        """Indexes newly stored chunks for a session."""
+        session_id = str(session_id)
+        term_counts = [Counter(tokenize(text)) for text in texts]
+        with self._lock:
+            conn = self._get_conn()
+            previous_version = self._read_version(session_id)
+            conn.executemany(
+                "INSERT OR REPLACE INTO lexical_chunks (chunk_id, session_id, length) VALUES (?, ?, ?)",
+                [(chunk_id, session_id, sum(counts.values())) for chunk_id, counts in zip(chunk_ids, term_counts)]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO lexical_postings (session_id, term, chunk_id, tf) VALUES (?, ?, ?, ?)",
+                [
+                    (session_id, term, chunk_id, tf)
+                    for chunk_id, counts in zip(chunk_ids, term_counts)
+                    for term, tf in counts.items()
+                ]
+            )
+            conn.execute(
+                "INSERT INTO lexical_sessions (session_id, version) VALUES (?, 1) "
+                "ON CONFLICT(session_id) DO UPDATE SET version = version + 1",
+                (session_id,)
+            )
+            version = self._read_version(session_id)
+            conn.commit()
+
+            # Keep an already-loaded session in sync instead of reloading it, unless another
+            # worker also wrote to it since it was loaded
+            index = self._sessions.get(session_id)
+            if index is not None:
+                if index.version == previous_version and version == previous_version + 1:
+                    for chunk_id, counts in zip(chunk_ids, term_counts):
+                        index.add(chunk_id, counts)
+                    index.version = version
+                else:
+                    del self._sessions[session_id]
+
+    def search(self, session_id, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Returns up to k (chunk_id, bm25_score) pairs, best first."""
+        query_terms = set(tokenize(query))
+        if not query_terms:
+            return []
+
+        with self._lock:
+            index = self._load_session(str(session_id))
+            doc_count = len(index.lengths)
+            if not doc_count:
+                return []
+            avg_length = index.total_length / doc_count
+
+            scores: Dict[str, float] = {}
+            for term in query_terms:
+                postings = index.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    norm = K1 * (1 - B + B * index.lengths[chunk_id] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._sessions.clear()
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Merges several ranked id lists into one, scoring each id by sum(1 / (k + rank))."""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            fused[item_id] = fused.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+lexical_index = LexicalIndex(settings.lexical_index_path)
@@ -1,7 +1,249 @@
+import asyncio
+import math
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from config import settings
 
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+RATE_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
 
-limiter = Limiter(key_func=get_remote_address)
 
+@dataclass(frozen=True)
+class RateLimit:
+    """A token bucket: up to `capacity` requests at once, refilled at `refill_per_second`."""
+    capacity: int
+    refill_per_second: float
+    spec: str
+
+
+def parse_rate(spec: str) -> RateLimit:
+    """Parses limits written like "30/minute" or "5/second"."""
+    try:
+        count, unit = spec.strip().split("/")
+        capacity = int(count)
+        seconds = RATE_UNITS[unit.strip().rstrip("s")]
+    except (ValueError, KeyError):
+        raise ValueError(f"Invalid rate limit '{spec}', expected e.g. '30/minute'")
+    return RateLimit(capacity=capacity, refill_per_second=capacity / seconds, spec=spec)
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+
+class RateLimited(Exception):
+    """Raised when a bucket is empty; main.py turns it into a 429 with Retry-After."""
+
+    def __init__(self, limit: RateLimit, result: RateLimitResult):
+        super().__init__(f"Rate limit exceeded: {limit.spec}")
+        self.limit = limit
+        self.result = result
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {
+            "Retry-After": str(max(1, math.ceil(self.result.retry_after))),
+            "X-RateLimit-Limit": str(self.limit.capacity),
+            "X-RateLimit-Remaining": str(self.result.remaining),
+        }
+
+
+def refill_and_take(
+    tokens: Optional[float],
+    updated_at: Optional[float],
+    now: float,
+    limit: RateLimit,
+    cost: int = 1
+) -> Tuple[bool, float, float]:
+    """
+    Token-bucket step shared by the backends. Returns (allowed, tokens left,
+    seconds until `cost` tokens are available). A missing bucket starts full.
+    A negative cost gives tokens back, up to the bucket's capacity.
+    """
+    if tokens is None:
+        tokens = float(limit.capacity)
+    else:
+        tokens = min(float(limit.capacity), tokens + max(0.0, now - updated_at) * limit.refill_per_second)
+    if tokens >= cost:
+        return True, min(float(limit.capacity), tokens - cost), 0.0
+    return False, tokens, (cost - tokens) / limit.refill_per_second
+
+
+class SQLiteBucketStore:
+    """
+    Buckets in a local SQLite file, shared by every worker on the host.
+
+    Each check is one short BEGIN IMMEDIATE transaction on a WAL database, so
+    concurrent workers serialize on the file lock rather than racing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _get_conn(self) -> sqlite3.Connection:
+        # Caller must hold self._lock
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=1.0)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+        return self._conn
+
+    async def take(self, key: str, limit: RateLimit, cost: int = 1) -> Tuple[bool, float, float]:
+        # Usually well under a millisecond, but under contention the lock and busy wait can block for up
+        # to the timeout, so the transaction runs off the event loop
+        return await asyncio.to_thread(self._take, key, limit, cost)
+
+    def _take(self, key: str, limit: RateLimit, cost: int) -> Tuple[bool, float, float]:
+        with self._lock:
+            conn = self._get_conn()
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                allowed, tokens, retry_after = refill_and_take(
+                    row[0] if row else None, row[1] if row else None, now, limit, cost
+                )
+                conn.execute(
+                    "INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                    (key, tokens, now)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return allowed, tokens, retry_after
+
+    async def close(self):
+        await asyncio.to_thread(self._close)
+
+    def _close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Same step as refill_and_take, run atomically inside Redis
+REDIS_TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1])
+if tokens == nil then
+    tokens = capacity
+else
+    tokens = math.min(capacity, tokens + math.max(0, now - tonumber(bucket[2])) * rate)
+end
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    allowed = 1
+    tokens = math.min(capacity, tokens - cost)
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(tokens), tostring(retry_after)}
+"""
+
+
+class RedisBucketStore:
+    """Buckets in Redis (or any server speaking its protocol), shared across hosts."""
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("rate_limit_backend 'redis' requires the 'redis' package")
+        self.prefix = prefix
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(REDIS_TOKEN_BUCKET)
+
+    async def take(self, key: str, limit: RateLimit, cost: int = 1) -> Tuple[bool, float, float]:
+        allowed, tokens, retry_after = await self._script(
+            keys=[self.prefix + key],
+            args=[limit.capacity, limit.refill_per_second, time.time(), cost]
+        )
+        return bool(allowed), float(tokens), float(retry_after)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+class TokenBucketLimiter:
+    """
+    Per-key token buckets on a pluggable shared store.
+
+    If the store is unreachable the request is let through; rate limiting
+    should never take the API down with it.
+    """
+
+    def __init__(self, store, enabled: bool = True):
+        self.store = store
+        self.enabled = enabled
+        self._stats = {"allowed": 0, "limited": 0, "errors": 0}
+
+    async def hit(self, key: str, limit: RateLimit, cost: int = 1) -> RateLimitResult:
+        if not self.enabled:
+            return RateLimitResult(allowed=True, remaining=limit.capacity, retry_after=0.0)
+        try:
+            allowed, tokens, retry_after = await self.store.take(key, limit, cost)
+        except Exception as e:
+            self._stats["errors"] += 1
+            print(f"--- ERROR: Rate limit check failed for {key}, allowing request: {e} ---")
+            return RateLimitResult(allowed=True, remaining=limit.capacity, retry_after=0.0)
+        self._stats["allowed" if allowed else "limited"] += 1
+        return RateLimitResult(allowed=allowed, remaining=int(tokens), retry_after=retry_after)
+
+    async def enforce(self, key: str, spec: str, cost: int = 1) -> RateLimitResult:
+        """Takes `cost` tokens from the bucket for `key`, or raises RateLimited."""
+        limit = parse_rate(spec)
+        result = await self.hit(key, limit, cost)
+        if not result.allowed:
+            raise RateLimited(limit, result)
+        return result
+
+    async def refund(self, key: str, spec: str, cost: int = 1):
+        """Gives back tokens taken by enforce(), e.g. for a request that turned out not to count."""
+        if not self.enabled:
+            return
+        try:
+            await self.store.take(key, parse_rate(spec), -cost)
+        except Exception as e:
+            print(f"--- ERROR: Rate limit refund failed for {key}: {e} ---")
+
+    def get_stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats["backend"] = type(self.store).__name__
+        return stats
+
+    async def close(self):
+        await self.store.close()
+
+
+def _build_store():
+    if settings.rate_limit_backend == "redis":
+        return RedisBucketStore(settings.rate_limit_redis_url)
+    if settings.rate_limit_backend == "sqlite":
+        return SQLiteBucketStore(settings.rate_limit_sqlite_path)
+    raise ValueError(f"Unknown rate_limit_backend '{settings.rate_limit_backend}'")
+
+
+limiter = TokenBucketLimiter(_build_store(), enabled=settings.rate_limit_enabled)
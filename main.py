@@ -1,13 +1,19 @@
-from fastapi import FastAPI
-from database import create_db_and_tables
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from database import create_db_and_tables, close_async_engine
 import auth
 import users
 import chats
 import rag
+from rag_service import init_vector_store, close_vector_store
+from ingestion_service import ingestion_queue
+from summary_service import conversation_summarizer
+from usage_aggregator import usage_aggregator
+from web_search_service import search_service
+from security import PasswordHashingBusy, password_hashing_pool
+from token_counter import preload_encodings
 from middleware import setup_cors
-from limiter import limiter
-from slowapi import _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
+from limiter import limiter, RateLimited
 
 
 app = FastAPI(
@@ -16,13 +22,47 @@ app = FastAPI(
     version="1.0.0",
 
 )   
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)  
+
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request: Request, exc: RateLimited):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": f"Rate limit exceeded ({exc.limit.spec}). Try again in {exc.headers['Retry-After']} seconds."},
+        headers=exc.headers,
+    )
+
+@app.exception_handler(PasswordHashingBusy)
+async def password_hashing_busy_handler(request: Request, exc: PasswordHashingBusy):
+    # A login/registration burst is already queued; ask the client to retry shortly
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please try again shortly."},
+        headers={"Retry-After": "1"},
+    )
 setup_cors(app)
 
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    ingestion_queue.fail_interrupted_jobs()
+    usage_aggregator.start()
+    preload_encodings()
+    try:
+        init_vector_store()
+    except Exception as e:
+        # The store is opened lazily on first use if it cannot be opened here
+        print(f"--- ERROR: Could not open vector store at startup: {e} ---")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    ingestion_queue.shutdown()
+    conversation_summarizer.shutdown()
+    usage_aggregator.shutdown()
+    password_hashing_pool.shutdown()
+    close_vector_store()
+    await search_service.aclose()
+    await limiter.close()
+    await close_async_engine()
 
 app.include_router(auth.router)
 app.include_router(users.router)
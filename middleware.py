@@ -17,5 +17,5 @@ def setup_cors(app: FastAPI):
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
-        expose_headers=["X-Session-ID", "X-Session-Created"]
+        expose_headers=["X-Session-ID", "X-Session-Created", "Server-Timing", "Retry-After"]
     )
@@ -0,0 +1,119 @@
+import threading
+import time
+from datetime import datetime, UTC
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class ModelRegistry:
+    """
+    Process-wide pool of LLM clients keyed by (provider, model_name).
+
+    Each client is built once and reused across requests so its underlying
+    HTTP connection pool stays warm instead of paying a TLS handshake on every
+    chat turn. Clients can be evicted or rebuilt explicitly.
+
+    Clients are built under a per-key lock, so a slow build for one model
+    neither blocks lookups of other models nor runs twice for the same one.
+    """
+
+    def __init__(self):
+        self._clients: Dict[Tuple[str, str], Any] = {}
+        self._stats: Dict[Tuple[str, str], Dict] = {}
+        self._build_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _get_stats_entry(self, key: Tuple[str, str]) -> Dict:
+        if key not in self._stats:
+            self._stats[key] = {
+                "hits": 0,
+                "misses": 0,
+                "builds": 0,
+                "evictions": 0,
+                "last_build_ms": 0.0,
+                "total_build_ms": 0.0,
+                "built_at": None,
+            }
+        return self._stats[key]
+
+    def _get_build_lock(self, key: Tuple[str, str]) -> threading.Lock:
+        # Caller must hold self._lock
+        if key not in self._build_locks:
+            self._build_locks[key] = threading.Lock()
+        return self._build_locks[key]
+
+    def _build(self, key: Tuple[str, str], factory: Callable[[], Any]) -> Any:
+        # Caller must hold the key's build lock, not self._lock
+        start = time.perf_counter()
+        client = factory()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            stats = self._get_stats_entry(key)
+            stats["builds"] += 1
+            stats["last_build_ms"] = round(elapsed_ms, 3)
+            stats["total_build_ms"] = round(stats["total_build_ms"] + elapsed_ms, 3)
+            stats["built_at"] = datetime.now(UTC).isoformat()
+            self._clients[key] = client
+        print(f"--- INFO: Built LLM client for {key[0]}:{key[1]} in {elapsed_ms:.1f}ms ---")
+        return client
+
+    def get_or_create(self, provider: str, model_name: str, factory: Callable[[], Any]) -> Any:
+        """Return the cached client for (provider, model_name), building it on first use."""
+        key = (provider, model_name)
+        with self._lock:
+            stats = self._get_stats_entry(key)
+            client = self._clients.get(key)
+            if client is not None:
+                stats["hits"] += 1
+                return client
+
+            stats["misses"] += 1
+            build_lock = self._get_build_lock(key)
+
+        with build_lock:
+            # Another thread may have built it while this one waited
+            with self._lock:
+                client = self._clients.get(key)
+            if client is not None:
+                return client
+            return self._build(key, factory)
+
+    def evict(self, provider: str, model_name: str) -> bool:
+        """Drop a cached client. Returns True if one was cached."""
+        key = (provider, model_name)
+        with self._lock:
+            client = self._clients.pop(key, None)
+            if client is None:
+                return False
+            self._get_stats_entry(key)["evictions"] += 1
+            print(f"--- INFO: Evicted LLM client for {provider}:{model_name} ---")
+            return True
+
+    def reload(self, provider: str, model_name: str, factory: Callable[[], Any]) -> Any:
+        """Rebuild a client unconditionally, replacing any cached instance."""
+        key = (provider, model_name)
+        with self._lock:
+            build_lock = self._get_build_lock(key)
+        with build_lock:
+            with self._lock:
+                if self._clients.pop(key, None) is not None:
+                    self._get_stats_entry(key)["evictions"] += 1
+            return self._build(key, factory)
+
+    def get_stats(self, provider: Optional[str] = None) -> Dict[str, Dict]:
+        """Per-model hit/miss counters and client construction times."""
+        with self._lock:
+            result = {}
+            for (key_provider, key_model), stats in self._stats.items():
+                if provider and key_provider != provider:
+                    continue
+                entry = dict(stats)
+                entry["provider"] = key_provider
+                entry["cached"] = (key_provider, key_model) in self._clients
+                lookups = entry["hits"] + entry["misses"]
+                entry["hit_rate"] = round(entry["hits"] / lookups, 4) if lookups else 0.0
+                result[f"{key_provider}:{key_model}"] = entry
+            return result
+
+
+model_registry = ModelRegistry()
@@ -1,8 +1,10 @@
+import uuid
 from typing import Optional,List 
 from sqlmodel import Field,SQLModel,Relationship
 from enum import Enum
-from sqlalchemy import DateTime
+from sqlalchemy import DateTime, Index, event, update
 from datetime import datetime,timedelta,UTC
+from datetime import date as date_type
 from pydantic import EmailStr
 
 class Role(str,Enum):
@@ -12,6 +14,8 @@ class Role(str,Enum):
 
 class ChatSession(SQLModel, table=True):
     __tablename__ = "chat_sessions"
+    # Listing a user's sessions by recent activity, including keyset pages on (last_activity_at, id)
+    __table_args__ = (Index("ix_chat_sessions_user_id_last_activity_at_id", "user_id", "last_activity_at", "id"),)
 
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str = Field(index=True, description="The title of the chat session, usually the first prompt.")
@@ -23,6 +27,10 @@ class ChatSession(SQLModel, table=True):
     user: "User" = Relationship(back_populates="sessions")
     
     has_documents: bool = Field(default=False)
+
+    # Rolling summary of the turns that have fallen out of the history window
+    summary: Optional[str] = Field(default=None)
+    summary_through_message_id: Optional[int] = Field(default=None)
     
     # Establishes the one-to-many relationship to ChatMessage
     # messages: List["ChatMessage"] = Relationship(back_populates="session")
@@ -32,10 +40,14 @@ class ChatSession(SQLModel, table=True):
     )
     
     created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    # Time of the newest message; kept current by the ChatMessage insert hook below
+    last_activity_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
 
 
 class ChatMessage(SQLModel, table=True):
     __tablename__ = "chat_messages"
+    # Loading a session's history in order, including keyset pages on (created_at, id)
+    __table_args__ = (Index("ix_chat_messages_session_id_created_at_id", "session_id", "created_at", "id"),)
 
     id: Optional[int] = Field(default=None, primary_key=True)
     content: str
@@ -51,6 +63,16 @@ class ChatMessage(SQLModel, table=True):
     
     created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
 
+
+@event.listens_for(ChatMessage, "after_insert")
+def _touch_session_activity(mapper, connection, target: ChatMessage):
+    """Bumps the parent session's last_activity_at in the same transaction as the message insert."""
+    connection.execute(
+        update(ChatSession.__table__)
+        .where(ChatSession.__table__.c.id == target.session_id)
+        .values(last_activity_at=target.created_at)
+    )
+
 class User(SQLModel,table = True):
     __tablename__ = "users"
 
@@ -118,19 +140,24 @@ class Token_data(SQLModel):
 
 class UsageStats(SQLModel, table=True):
     __tablename__ = "usage_stats"
+    # One row per user per UTC day; write-behind flushes upsert on this key
+    __table_args__ = (Index("ux_usage_stats_user_day", "user_id", "day", unique=True),)
     
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="users.id")
     
     # Daily aggregates
     date: datetime = Field(index=True)
+    day: Optional[date_type] = Field(default=None)
     messages_sent: int = Field(default=0)
     tokens_used: int = Field(default=0)
+    prompt_tokens: int = Field(default=0)
+    completion_tokens: int = Field(default=0)
     sessions_created: int = Field(default=0)
     web_searches_made: int = Field(default=0)
     
-    # Model usage tracking
-    model_usage: Optional[str] = Field(default="{}")  # JSON string storing model usage counts
+    # Legacy JSON model counts; per-model usage now lives in usage_model_daily
+    model_usage: Optional[str] = Field(default="{}")
     
     created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
     updated_at: Optional[datetime] = Field(
@@ -142,10 +169,60 @@ class UsageStats(SQLModel, table=True):
     user: "User" = Relationship()
 
 
+class UsageModelDaily(SQLModel, table=True):
+    """Per-model message and token counts for one user and UTC day."""
+    __tablename__ = "usage_model_daily"
+
+    # The composite primary key doubles as the (user_id, day) range index
+    user_id: int = Field(foreign_key="users.id", primary_key=True)
+    day: date_type = Field(primary_key=True)
+    model: str = Field(primary_key=True)
+    messages: int = Field(default=0)
+    tokens: int = Field(default=0)
+
+
+class UserUsageTotals(SQLModel, table=True):
+    """Lifetime usage per user, incremented alongside the daily rows."""
+    __tablename__ = "user_usage_totals"
+
+    user_id: int = Field(foreign_key="users.id", primary_key=True)
+    total_messages: int = Field(default=0)
+    total_tokens: int = Field(default=0)
+    total_prompt_tokens: int = Field(default=0)
+    total_completion_tokens: int = Field(default=0)
+    total_sessions: int = Field(default=0)
+    total_searches: int = Field(default=0)
+    # Per-model lifetime counts are summed from usage_model_daily, not stored here
+    updated_at: Optional[datetime] = Field(default=None)
+
+
+class IngestionJob(SQLModel, table=True):
+    """Status and progress of one background document ingestion, readable from any worker."""
+    __tablename__ = "ingestion_jobs"
+
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex, primary_key=True)
+    session_id: int
+    user_id: int
+    filename: str
+    status: str = Field(default="queued")  # queued, running, completed, partial or failed
+    error: Optional[str] = Field(default=None)
+    pages_parsed: int = Field(default=0)
+    chunks_total: int = Field(default=0)
+    chunks_embedded: int = Field(default=0)
+    chunks_stored: int = Field(default=0)
+    chunks_failed: int = Field(default=0)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    started_at: Optional[datetime] = Field(default=None)
+    # Finished jobs are pruned by age
+    finished_at: Optional[datetime] = Field(default=None, index=True)
+
+
 class UsageStatsRead(SQLModel):
     date: datetime
     messages_sent: int
     tokens_used: int
+    prompt_tokens: int
+    completion_tokens: int
     sessions_created: int
     web_searches_made: int
     model_usage: dict
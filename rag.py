@@ -1,12 +1,15 @@
 # rag_routes.py
 import os
 import shutil
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+import uuid
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, status
 from sqlmodel import Session
 from database import get_session
 from models import ChatSession, User
-from dependencies import get_current_user
-from rag_service import process_and_store_document
+from dependencies import get_current_user, require_admin
+from ingestion_service import ingestion_queue, IngestionQueueFull
+from embedding_cache import embedding_cache
+from retrieval_cache import retrieval_cache
 
 router = APIRouter(
     prefix="/rag",
@@ -15,15 +18,23 @@ router = APIRouter(
 UPLOAD_DIRECTORY = "./temp_uploads"
 os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
 
-@router.post("/upload/{session_id}")
-async def upload_document_for_session(
+def _save_upload(file: UploadFile, file_path: str):
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+
+@router.post("/upload/{session_id}", status_code=status.HTTP_202_ACCEPTED)
+def upload_document_for_session(
     session_id: int,
     file: UploadFile = File(...),
     db: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Uploads a document, processes it, and associates it with a specific chat session.
+    Uploads a document and queues it for processing in the background.
+    Returns a job id; poll GET /rag/jobs/{job_id} for progress. The session is
+    marked as having documents only once the job completes.
+    Sync on purpose: the lookup, file copy and job insert all block, so FastAPI runs it in the threadpool.
     """
     # 1. Verify the chat session exists and belongs to the user
     chat_session = db.get(ChatSession, session_id)
@@ -31,31 +42,51 @@ async def upload_document_for_session(
     if not chat_session or chat_session.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Chat session not found")
 
-    file_path = ""
+    filename = os.path.basename(file.filename or "")
+    if not filename.endswith((".pdf", ".docx", ".txt")):
+        raise HTTPException(status_code=400, detail="Unsupported file type.")
+
+    # 2. Save the uploaded file under a unique name; the worker deletes it when done
+    file_path = os.path.join(UPLOAD_DIRECTORY, f"{uuid.uuid4().hex}_{filename}")
     try:
-        # 2. Save the uploaded file to a temporary location
-        file_path = os.path.join(UPLOAD_DIRECTORY, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # 3. Process the document and store embeddings with session_id metadata
-        print(f"--- DEBUG: Processing file {file.filename} for session {session_id} ---")
-        process_and_store_document(file_path, session_id)
-        
-        # 4. Mark the session as having documents
-        if not chat_session.has_documents:
-            chat_session.has_documents = True
-            db.add(chat_session)
-            db.commit()
-            db.refresh(chat_session)
-        print(f"--- DEBUG: Updated chat session {session_id} to have documents ---")
-        return {"message": f"Successfully processed {file.filename} for session {session_id}"}
-        
+        _save_upload(file, file_path)
     except Exception as e:
-        # Basic error handling
-        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
-    finally:
-        # 5. Clean up by deleting the temporary file
-        print(f"--- DEBUG: Cleaning up temporary file {file_path} ---")
         if os.path.exists(file_path):
-            os.remove(file_path)
\ No newline at end of file
+            os.remove(file_path)
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+    # 3. Queue the document for processing
+    try:
+        job = ingestion_queue.submit(session_id, current_user.id, filename, file_path)
+    except IngestionQueueFull as e:
+        os.remove(file_path)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+    return {
+        "message": f"Queued {filename} for processing in session {session_id}",
+        "job_id": job.id,
+        "status": job.status,
+    }
+
+
+@router.get("/jobs/{job_id}")
+def get_ingestion_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Returns the status and progress of a document ingestion job."""
+    job = ingestion_queue.get(job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job.id, **job.model_dump(exclude={"id", "user_id"})}
+
+
+@router.get("/embedding-cache/stats")
+def get_embedding_cache_stats(admin_user: User = Depends(require_admin)):
+    """
+    Hit/miss counters for the embedding cache. Every hit is one embedding call not sent to the provider.
+    """
+    return embedding_cache.get_stats()
+
+
+@router.get("/retrieval-cache/stats")
+def get_retrieval_cache_stats(admin_user: User = Depends(require_admin)):
+    """Hit/miss counters for the per-session retrieval cache."""
+    return retrieval_cache.get_stats()
@@ -1,64 +1,301 @@
 # rag_service.py
+import asyncio
 import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Iterable, Iterator
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_core.documents import Document
 from config import settings
+from embedding_cache import CachedEmbeddings, embedding_cache
+from lexical_index import lexical_index, reciprocal_rank_fusion
+from retrieval_cache import retrieval_cache
 
 # --- 1. Document Loading and Splitting ---
 
-def load_document(file_path: str) -> list[Document]:
-    """Loads a document based on its file extension."""
+def _get_loader(file_path: str):
     if file_path.endswith(".pdf"):
-        loader = PyPDFLoader(file_path)
+        return PyPDFLoader(file_path)
     elif file_path.endswith(".docx"):
-        loader = Docx2txtLoader(file_path)
+        return Docx2txtLoader(file_path)
     elif file_path.endswith(".txt"):
-        loader = TextLoader(file_path)
+        return TextLoader(file_path)
     else:
         raise ValueError("Unsupported file type.")
-    print(f"--- INFO: Loading document from {file_path} ---")
-    return loader.load()
 
-def split_text(documents: list[Document]) -> list[Document]:
-    """Splits documents into smaller chunks."""
-    text_splitter = RecursiveCharacterTextSplitter(
+def _get_text_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=200,
         length_function=len
     )
+
+def iter_document_pages(file_path: str) -> Iterator[Document]:
+    """Yields a document page by page instead of loading every page into memory."""
+    loader = _get_loader(file_path)
+    print(f"--- INFO: Streaming document from {file_path} ---")
+    yield from loader.lazy_load()
+
+def iter_chunks(pages: Iterable[Document]) -> Iterator[Document]:
+    """Splits pages into chunks as they arrive. Each page is split on its own, as split_documents does."""
+    text_splitter = _get_text_splitter()
+    for page in pages:
+        yield from text_splitter.split_documents([page])
+
+def load_document(file_path: str) -> list[Document]:
+    """Loads a document based on its file extension."""
+    loader = _get_loader(file_path)
+    print(f"--- INFO: Loading document from {file_path} ---")
+    return loader.load()
+
+def split_text(documents: list[Document]) -> list[Document]:
+    """Splits documents into smaller chunks."""
+    text_splitter = _get_text_splitter()
     print(f"--- INFO: Splitting {len(documents)} documents into chunks ---")
     return text_splitter.split_documents(documents)
 
 # --- 2. Vector Store and Retriever ---
 
+CHROMA_PERSIST_DIRECTORY = "./chroma_db_main"
+CHROMA_COLLECTION_NAME = "chatbot_rag"
+EMBEDDING_MODEL = "models/embedding-001"
+# Candidates fetched from each of the dense and lexical searches
+RETRIEVAL_K = 10
+
+
+class IngestionStopped(Exception):
+    """Raised between batches when the caller asked a running ingestion to stop."""
+
+# Process-wide handles, opened once (normally at startup) and shared by all requests
+_embeddings: CachedEmbeddings | None = None
+_vector_store: Chroma | None = None
+_vector_store_lock = threading.Lock()
+
+
+def get_embeddings() -> CachedEmbeddings:
+    """Returns the shared embedding client. Chunk and query embeddings go through the embedding cache."""
+    global _embeddings
+    if _embeddings is None:
+        with _vector_store_lock:
+            if _embeddings is None:
+                _embeddings = CachedEmbeddings(
+                    GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, google_api_key=settings.google_api_key),
+                    model_name=EMBEDDING_MODEL,
+                    cache=embedding_cache
+                )
+    return _embeddings
+
+
+def _warm_vector_store(vector_store: Chroma):
+    """Runs one ANN query with a stored vector so the HNSW segment is loaded before the first user query."""
+    try:
+        collection = vector_store._collection
+        sample = collection.get(limit=1, include=["embeddings"])
+        embeddings = sample.get("embeddings")
+        if embeddings is not None and len(embeddings) > 0:
+            collection.query(query_embeddings=[list(embeddings[0])], n_results=1)
+        print(f"--- INFO: Chroma vector store warmed ({collection.count()} chunks) ---")
+    except Exception as e:
+        print(f"--- ERROR: Failed to warm Chroma vector store: {e} ---")
+
+
+def init_vector_store() -> Chroma:
+    """Opens the persistent Chroma store once and warms its index. Safe to call repeatedly."""
+    global _vector_store
+    if _vector_store is None:
+        embeddings = get_embeddings()
+        with _vector_store_lock:
+            if _vector_store is None:
+                # Using a persistent directory and a single collection name
+                print("--- INFO: Initializing Chroma vector store ---")
+                vector_store = Chroma(
+                    persist_directory=CHROMA_PERSIST_DIRECTORY,
+                    embedding_function=embeddings,
+                    collection_name=CHROMA_COLLECTION_NAME
+                )
+                _warm_vector_store(vector_store)
+                _vector_store = vector_store
+    return _vector_store
+
+
+def close_vector_store():
+    """Releases the shared Chroma handle. Called on application shutdown."""
+    global _vector_store, _embeddings
+    with _vector_store_lock:
+        if _vector_store is not None:
+            try:
+                _vector_store._client.clear_system_cache()
+            except Exception as e:
+                print(f"--- ERROR: Failed to close Chroma vector store: {e} ---")
+            print("--- INFO: Chroma vector store closed ---")
+        _vector_store = None
+        _embeddings = None
+    embedding_cache.close()
+    lexical_index.close()
+
+
 def get_vector_store() -> Chroma:
-    """Initializes the Chroma vector store."""
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001" , google_api_key=settings.google_api_key)
-    # Using a persistent directory and a single collection name
-    print("--- INFO: Initializing Chroma vector store ---")
-    return Chroma(
-        persist_directory="./chroma_db_main",
-        embedding_function=embeddings,
-        collection_name="chatbot_rag"
-    )
+    """Returns the shared Chroma vector store, opening it on first use."""
+    if _vector_store is not None:
+        return _vector_store
+    return init_vector_store()
 
-def process_and_store_document(file_path: str, session_id: int):
-    """The complete pipeline for processing and storing a document with session metadata."""
-    # Load and split the document
-    documents = load_document(file_path)
-    chunks = split_text(documents)
+def _embed_batch_with_retry(texts: list[str]) -> list[list[float]]:
+    """Embeds one batch, retrying transient provider failures with exponential backoff."""
+    embeddings = get_embeddings()
+    attempt = 0
+    while True:
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as e:
+            if attempt >= settings.embedding_max_retries:
+                raise
+            delay = settings.embedding_retry_base_delay * (2 ** attempt) * (1 + random.random() * 0.25)
+            print(f"--- ERROR: Embedding batch failed ({e}), retrying in {delay:.1f}s ---")
+            time.sleep(delay)
+            attempt += 1
 
-    # Add session_id metadata to each chunk
+
+def _iter_batches(chunks: Iterable[Document], batch_size: int) -> Iterator[list[Document]]:
+    batch = []
     for chunk in chunks:
-        chunk.metadata = {"session_id": str(session_id)}
-    
-    # Get the vector store and add the new chunks
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _index_chunks_lexically(chunk_ids: list[str], batch: list[Document]):
+    by_session: dict[str, tuple[list, list]] = {}
+    for chunk_id, chunk in zip(chunk_ids, batch):
+        ids, texts = by_session.setdefault(chunk.metadata.get("session_id", ""), ([], []))
+        ids.append(chunk_id)
+        texts.append(chunk.page_content)
+    for session_id, (ids, texts) in by_session.items():
+        # Also bumps the session's version, so cached retrievals for it stop matching on every worker
+        lexical_index.add_chunks(session_id, ids, texts)
+        retrieval_cache.invalidate(session_id)
+
+
+def embed_and_store_chunks(
+    chunks: Iterable[Document],
+    vector_store: Chroma,
+    on_embedded: Callable[[int], None] | None = None,
+    on_stored: Callable[[int], None] | None = None,
+    should_stop: Callable[[], bool] | None = None,
+) -> tuple[int, int]:
+    """
+    Embeds chunks in provider-sized batches, with a bounded number of batches in flight,
+    and writes each batch to Chroma as soon as it is embedded. A batch that still fails
+    after its retries is skipped so the rest of the document is kept.
+
+    `chunks` may be a lazy iterator: it is only pulled while fewer than
+    embedding_max_in_flight_batches batches are pending, so parsing overlaps with
+    embedding and memory stays bounded regardless of document size.
+    `should_stop` is checked before each batch; once it returns True, batches
+    already in flight are finished and IngestionStopped is raised.
+    Returns (chunks_stored, chunks_failed).
+    """
+    max_in_flight = max(settings.embedding_max_in_flight_batches, settings.embedding_concurrency)
+    in_flight = {}
+    totals = {"stored": 0, "failed": 0}
+
+    def collect_finished():
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            batch = in_flight.pop(future)
+            try:
+                vectors = future.result()
+            except Exception as e:
+                totals["failed"] += len(batch)
+                print(f"--- ERROR: Dropping batch of {len(batch)} chunks after retries: {e} ---")
+                continue
+            if on_embedded:
+                on_embedded(len(batch))
+
+            # Vectors are already computed, so write them straight to the collection
+            chunk_ids = [str(uuid.uuid4()) for _ in batch]
+            vector_store._collection.upsert(
+                ids=chunk_ids,
+                embeddings=vectors,
+                documents=[chunk.page_content for chunk in batch],
+                metadatas=[chunk.metadata for chunk in batch],
+            )
+            _index_chunks_lexically(chunk_ids, batch)
+            totals["stored"] += len(batch)
+            if on_stored:
+                on_stored(len(batch))
+
+    with ThreadPoolExecutor(max_workers=settings.embedding_concurrency, thread_name_prefix="embedding") as executor:
+        for batch in _iter_batches(chunks, settings.embedding_batch_size):
+            while len(in_flight) >= max_in_flight:
+                collect_finished()
+            if should_stop and should_stop():
+                while in_flight:
+                    collect_finished()
+                raise IngestionStopped(f"Stopped after storing {totals['stored']} chunks")
+            future = executor.submit(_embed_batch_with_retry, [chunk.page_content for chunk in batch])
+            in_flight[future] = batch
+        while in_flight:
+            collect_finished()
+
+    return totals["stored"], totals["failed"]
+
+
+def process_and_store_document(
+    file_path: str,
+    session_id: int,
+    progress: Callable[..., None] | None = None,
+    should_stop: Callable[[], bool] | None = None
+) -> dict:
+    """
+    The complete pipeline for processing and storing a document with session metadata.
+    Pages are streamed from the loader, split and embedded incrementally, so the whole
+    document is never held in memory at once.
+    `progress` is called with updated counters (pages_parsed, chunks_total, chunks_embedded, chunks_stored).
+    `should_stop` is passed to embed_and_store_chunks().
+    Returns the number of chunks stored and failed.
+    """
+    report = progress or (lambda **counters: None)
+    counters = {"pages_parsed": 0, "chunks_total": 0, "chunks_embedded": 0, "chunks_stored": 0}
+
+    def count(name: str, amount: int = 1):
+        counters[name] += amount
+        report(**{name: counters[name]})
+
+    def pages():
+        for page in iter_document_pages(file_path):
+            count("pages_parsed")
+            yield page
+
+    def session_chunks():
+        for chunk in iter_chunks(pages()):
+            # Add session_id metadata to each chunk
+            chunk.metadata = {"session_id": str(session_id)}
+            count("chunks_total")
+            yield chunk
+
     vector_store = get_vector_store()
-    vector_store.add_documents(chunks)
-    print(f"--- INFO: Stored {len(chunks)} chunks for session_id: {session_id} ---")
+    stored, failed = embed_and_store_chunks(
+        session_chunks(),
+        vector_store,
+        on_embedded=lambda n: count("chunks_embedded", n),
+        on_stored=lambda n: count("chunks_stored", n),
+        should_stop=should_stop,
+    )
+    print(f"--- INFO: Stored {stored} chunks from {counters['pages_parsed']} pages for session_id: {session_id} ({failed} failed) ---")
+
+    if counters["chunks_total"] and not stored:
+        raise RuntimeError(f"Failed to embed any of the {counters['chunks_total']} chunks")
+    return {"chunks_stored": stored, "chunks_failed": failed}
 
 def get_session_retriever(session_id: int):
     """
@@ -72,23 +309,50 @@ def get_session_retriever(session_id: int):
 
 # ADD this new function after the existing get_session_retriever function (around line 45)
 
+def get_chunks_by_ids(vector_store: Chroma, chunk_ids: list[str]) -> dict[str, Document]:
+    """Fetches stored chunks by id, e.g. to hydrate lexical-only search hits."""
+    if not chunk_ids:
+        return {}
+    results = vector_store._collection.get(ids=chunk_ids, include=["documents", "metadatas"])
+    return {
+        chunk_id: Document(page_content=content, metadata=metadata or {}, id=chunk_id)
+        for chunk_id, content, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+    }
+
+
+def ensure_lexical_index(session_id: int, vector_store: Chroma):
+    """Builds the lexical index for sessions whose documents were stored before it existed."""
+    if lexical_index.has_session(session_id):
+        return
+    results = vector_store._collection.get(where={"session_id": str(session_id)}, include=["documents"])
+    if results["ids"]:
+        print(f"--- INFO: Backfilling lexical index with {len(results['ids'])} chunks for session_id: {session_id} ---")
+        lexical_index.add_chunks(session_id, results["ids"], results["documents"])
+
+
+async def _await_stage(name: str, awaitable, deadline: float):
+    """Default stage runner: applies the deadline and yields None if the stage misses it or fails."""
+    try:
+        return await asyncio.wait_for(awaitable, timeout=deadline)
+    except asyncio.TimeoutError:
+        print(f"--- INFO: Retrieval stage '{name}' missed its {deadline}s deadline ---")
+    except Exception as e:
+        print(f"--- ERROR: Retrieval stage '{name}' failed: {e} ---")
+    return None
+
+
 def get_session_retriever_with_scores(session_id: int, similarity_threshold: float = 0.9):
     """
-    Creates a retriever that returns documents with similarity scores and filters by threshold.
-    Only returns documents that meet the minimum similarity threshold.
+    Creates a hybrid retriever for the session. Dense results that meet the similarity
+    threshold are merged with BM25 matches from the session's lexical index, so
+    exact-term queries (part numbers, names, clause IDs) are not missed.
     """
     vector_store = get_vector_store()
     print(f"--- INFO: Creating retriever with similarity threshold {similarity_threshold} for session_id: {session_id} ---")
     
-    # Get documents with scores using similarity_search_with_score
-    def retrieve_with_filtering(query: str) -> list:
-        # Perform similarity search with scores
-        docs_with_scores = vector_store.similarity_search_with_score(
-            query, 
-            k=10,  # Get more documents initially
-            filter={"session_id": str(session_id)}
-        )
-        
+    ensure_lexical_index(session_id, vector_store)
+
+    def filter_by_threshold(docs_with_scores: list) -> list:
         print(f"--- DEBUG: Retrieved {len(docs_with_scores)} documents before filtering ---")
         
         # Filter by similarity threshold
@@ -100,21 +364,113 @@ def get_session_retriever_with_scores(session_id: int, similarity_threshold: flo
                 filtered_docs.append(doc)
             else:
                 print(f"--- DEBUG: Document filtered out due to low similarity ---")
-        
-        if not filtered_docs and docs_with_scores:
+        return filtered_docs
+
+    def fuse_with_lexical(query: str, docs_with_scores: list) -> list:
+        """Returns (document, score) pairs, best first."""
+        dense_docs = filter_by_threshold(docs_with_scores)
+        lexical_hits = lexical_index.search(session_id, query, k=RETRIEVAL_K)
+        print(f"--- DEBUG: Lexical search matched {len(lexical_hits)} chunks ---")
+
+        # Merge the dense and lexical rankings with reciprocal rank fusion
+        docs_by_id = {doc.id: doc for doc in dense_docs}
+        fused = reciprocal_rank_fusion([
+            [doc.id for doc in dense_docs],
+            [chunk_id for chunk_id, _ in lexical_hits],
+        ])[:RETRIEVAL_K]
+
+        missing_ids = [chunk_id for chunk_id, _ in fused if chunk_id not in docs_by_id]
+        docs_by_id.update(get_chunks_by_ids(vector_store, missing_ids))
+        results = [(docs_by_id[chunk_id], score) for chunk_id, score in fused if chunk_id in docs_by_id]
+
+        if not results and docs_with_scores:
             print("--- INFO: No documents passed threshold, returning top-scoring document as fallback ---")
             print(f"--- DEBUG: Top-scoring document: {docs_with_scores[0][0]} ---")
-            filtered_docs.append(docs_with_scores[0][0])
+            results.append(docs_with_scores[0])
 
-        print(f"--- INFO: {len(filtered_docs)} documents passed similarity threshold ---")
-        return filtered_docs
+        print(f"--- INFO: {len(results)} documents passed hybrid retrieval ---")
+        return results
+
+    def get_cached(query: str, version: int) -> list | None:
+        cached = retrieval_cache.get(session_id, version, query, RETRIEVAL_K, similarity_threshold)
+        if cached is None:
+            return None
+        docs_by_id = get_chunks_by_ids(vector_store, [chunk_id for chunk_id, _ in cached])
+        print(f"--- INFO: Retrieval cache hit for session_id: {session_id}, skipping vector search ---")
+        return [docs_by_id[chunk_id] for chunk_id, _ in cached if chunk_id in docs_by_id]
+
+    def cache_results(query: str, version: int, results: list) -> list:
+        retrieval_cache.put(
+            session_id, version, query, RETRIEVAL_K, similarity_threshold,
+            [(doc.id, score) for doc, score in results]
+        )
+        return [doc for doc, _ in results]
+
+    # Get documents with scores using similarity_search_with_score
+    def retrieve_with_filtering(query: str) -> list:
+        version = lexical_index.get_version(session_id)
+        cached = get_cached(query, version)
+        if cached is not None:
+            return cached
+
+        # Perform similarity search with scores
+        docs_with_scores = vector_store.similarity_search_with_score(
+            query, 
+            k=RETRIEVAL_K,  # Get more documents initially
+            filter={"session_id": str(session_id)}
+        )
+        return cache_results(query, version, fuse_with_lexical(query, docs_with_scores))
+
+    async def aretrieve_with_filtering(query: str, run_stage: Callable | None = None) -> list:
+        """
+        Query embedding and vector search run as separate stages so a caller can time
+        them and give each its own deadline. If either misses it, the lexical ranking
+        alone is used rather than dropping the BM25 hits too; those partial results
+        aren't cached.
+        """
+        run_stage = run_stage or _await_stage
+        # Chroma and the BM25 index are blocking calls; keep them off the event loop
+        version = await asyncio.to_thread(lexical_index.get_version, session_id)
+        cached = await asyncio.to_thread(get_cached, query, version)
+        if cached is not None:
+            return cached
+
+        query_embedding = await run_stage(
+            "query_embedding",
+            asyncio.to_thread(get_embeddings().embed_query, query),
+            settings.query_embedding_deadline_seconds
+        )
+
+        docs_with_scores = None
+        if query_embedding is not None:
+            docs_with_scores = await run_stage(
+                "vector_search",
+                asyncio.to_thread(
+                    vector_store.similarity_search_by_vector_with_relevance_scores,
+                    query_embedding,
+                    k=RETRIEVAL_K,
+                    filter={"session_id": str(session_id)}
+                ),
+                settings.vector_search_deadline_seconds
+            )
+        if docs_with_scores is None:
+            print(f"--- INFO: Dense retrieval unavailable for session_id: {session_id}, using lexical results only ---")
+            results = await asyncio.to_thread(fuse_with_lexical, query, [])
+            return [doc for doc, _ in results]
+
+        results = await asyncio.to_thread(fuse_with_lexical, query, docs_with_scores)
+        return cache_results(query, version, results)
     
     # Create a custom retriever that uses our filtering function
     class FilteredRetriever:
-        def __init__(self, retrieve_func):
+        def __init__(self, retrieve_func, aretrieve_func):
             self.retrieve_func = retrieve_func
+            self.aretrieve_func = aretrieve_func
             
         def get_relevant_documents(self, query: str):
             return self.retrieve_func(query)
+
+        async def aget_relevant_documents(self, query: str, run_stage: Callable | None = None):
+            return await self.aretrieve_func(query, run_stage)
     
-    return FilteredRetriever(retrieve_with_filtering)
\ No newline at end of file
+    return FilteredRetriever(retrieve_with_filtering, aretrieve_with_filtering)
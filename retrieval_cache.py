@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from embedding_cache import normalize_text
+from config import settings
+
+
+class RetrievalCache:
+    """
+    Bounded LRU of retrieval results per chat session.
+
+    Entries hold the chunk ids and scores a query retrieved, keyed by
+    (session_id, session version, normalized query, k, threshold). The version
+    is the one the lexical index stores next to its postings, which every
+    upload bumps whichever worker handled it; a lookup made after an upload
+    asks for the new version and can't match results computed before it.
+    Workers only share versions if they share the lexical index file, the
+    same way they must share the Chroma directory.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, List[Tuple[str, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _key(self, session_id, version: int, query: str, k: int, threshold: float) -> tuple:
+        return (str(session_id), version, normalize_text(query).casefold(), k, threshold)
+
+    def get(self, session_id, version: int, query: str, k: int, threshold: float) -> Optional[List[Tuple[str, float]]]:
+        with self._lock:
+            key = self._key(session_id, version, query, k, threshold)
+            result = self._entries.get(key)
+            if result is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return result
+
+    def put(self, session_id, version: int, query: str, k: int, threshold: float, result: List[Tuple[str, float]]):
+        """
+        Stores a result computed against `version`, which must be read before searching; a
+        result that raced an upload is then filed under the old version and never served.
+        """
+        with self._lock:
+            key = self._key(session_id, version, query, k, threshold)
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, session_id):
+        """
+        Drops this worker's entries for the session. Not needed for correctness, since
+        old-version entries can't be hit again, but frees them without waiting for LRU eviction.
+        """
+        with self._lock:
+            session_id = str(session_id)
+            self._stats["invalidations"] += 1
+            for key in [key for key in self._entries if key[0] == session_id]:
+                del self._entries[key]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+retrieval_cache = RetrievalCache(settings.retrieval_cache_max_entries)
@@ -1,10 +1,15 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, UTC
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes made with another cost (or a deprecated scheme) verify fine and report needs_update
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
 
 def verify_password(plain_password,hashed_password):
     return pwd_context.verify(plain_password,hashed_password)
@@ -13,6 +18,91 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+class PasswordHashingBusy(RuntimeError):
+    """Raised when the hashing pool's queue is full."""
+
+
+class PasswordHashingPool:
+    """
+    Small dedicated thread pool for bcrypt work.
+
+    A bcrypt call takes tens to hundreds of milliseconds of CPU. Running it on
+    the event loop stalls every stream on the worker, and running it on the
+    default threadpool lets a login burst take all of those threads. This pool
+    caps concurrent hashes at `workers` and rejects work once `max_queue`
+    calls are waiting, so a burst fails fast instead of piling up.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 64):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._stats = {"completed": 0, "rejected": 0, "rehashed": 0, "wait_ms_total": 0.0, "run_ms_total": 0.0}
+
+    def _timed(self, submitted_at: float, func, *args):
+        started = time.perf_counter()
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._stats["wait_ms_total"] += (started - submitted_at) * 1000
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._stats["completed"] += 1
+                self._stats["run_ms_total"] += (time.perf_counter() - started) * 1000
+
+    async def _run(self, func, *args):
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise PasswordHashingBusy("Password hashing queue is full")
+            self._queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._timed, time.perf_counter(), func, *args)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(pwd_context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verifies the password and, if the stored hash uses an outdated cost or
+        scheme, also returns a new hash for the caller to store.
+        """
+        valid, new_hash = await self._run(pwd_context.verify_and_update, password, hashed_password)
+        if new_hash:
+            with self._lock:
+                self._stats["rehashed"] += 1
+        return valid, new_hash
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queue_depth"] = self._queued
+            stats["running"] = self._running
+        completed = stats["completed"]
+        stats["avg_wait_ms"] = round(stats.pop("wait_ms_total") / completed, 2) if completed else 0.0
+        stats["avg_run_ms"] = round(stats.pop("run_ms_total") / completed, 2) if completed else 0.0
+        stats.update(workers=self.workers, max_queue=self.max_queue, bcrypt_rounds=settings.bcrypt_rounds)
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hashing_pool = PasswordHashingPool(
+    workers=settings.password_hash_workers,
+    max_queue=settings.password_hash_max_queue,
+)
+
+
 def create_access_token(data: dict,expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -20,7 +110,8 @@ def create_access_token(data: dict,expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.now(UTC) +  timedelta(minutes=15)
     
-    to_encode.update({"exp" : expire})
+    # iat lets the auth user cache tell tokens of the same user apart
+    to_encode.update({"exp" : expire, "iat": datetime.now(UTC)})
     encoded_jwt = jwt.encode(to_encode,settings.secret_key,algorithm=settings.algorithm)
     return encoded_jwt
 
@@ -0,0 +1,125 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Set
+from sqlmodel import Session, select
+from database import engine, write_engine
+from models import ChatSession, ChatMessage
+from history_service import load_history_window
+from chatbot_service import get_model_instance, get_history_token_budget, MODELS
+from config import settings
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and an AI assistant.
+Update the existing summary with the new messages below. Keep facts, names, numbers, decisions and open
+questions the assistant may need later; drop small talk. Write at most {max_words} words of plain prose.
+
+Existing summary:
+{summary}
+
+New messages:
+{transcript}
+
+Updated summary:"""
+
+
+def _format_transcript(messages) -> str:
+    lines = []
+    for msg in messages:
+        speaker = "User" if msg.role == "user" else "Assistant"
+        lines.append(f"{speaker}: {msg.content}")
+    return "\n".join(lines)
+
+
+def update_session_summary(chat_session_id: int, model_name: str) -> bool:
+    """
+    Folds messages that have fallen out of the session's history window into
+    its rolling summary. Returns True if the summary changed.
+    """
+    with Session(engine) as db:
+        chat_session = db.get(ChatSession, chat_session_id)
+        if not chat_session:
+            return False
+        previous_summary = chat_session.summary
+        summary_through = chat_session.summary_through_message_id
+
+        window = load_history_window(
+            db,
+            chat_session_id,
+            get_history_token_budget(model_name),
+            after_message_id=summary_through,
+            provider=MODELS.get(model_name, {}).get("provider")
+        )
+        if not window:
+            return False
+
+        # Messages newer than the summary but older than the window start
+        statement = (
+            select(ChatMessage)
+            .where(ChatMessage.session_id == chat_session_id)
+            .where(ChatMessage.id < window[0].id)
+            .order_by(ChatMessage.id)
+            .limit(settings.summary_max_messages_per_update)
+        )
+        if summary_through is not None:
+            statement = statement.where(ChatMessage.id > summary_through)
+        evicted = db.exec(statement).all()
+        if not evicted:
+            return False
+        transcript = _format_transcript(evicted)
+        last_evicted_id = evicted[-1].id
+
+    # The LLM call happens outside any transaction so it never holds the writer connection
+    llm = get_model_instance(settings.summary_model_name)
+    response = llm.invoke(SUMMARY_PROMPT.format(
+        max_words=settings.summary_max_words,
+        summary=previous_summary or "(none yet)",
+        transcript=transcript
+    ))
+    summary = response.content if isinstance(response.content, str) else str(response.content)
+
+    with Session(write_engine) as db:
+        chat_session = db.get(ChatSession, chat_session_id)
+        if not chat_session or chat_session.summary_through_message_id != summary_through:
+            # The session was deleted or summarized concurrently
+            return False
+        chat_session.summary = summary.strip()
+        chat_session.summary_through_message_id = last_evicted_id
+        db.add(chat_session)
+        db.commit()
+    print(f"--- DEBUG: Folded {len(evicted)} messages into the summary of session {chat_session_id} ---")
+    return True
+
+
+class ConversationSummarizer:
+    """
+    Single background worker that keeps rolling summaries up to date after each
+    bot reply. Requests for a session that is already queued are coalesced.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+        self._pending: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, chat_session_id: int, model_name: str):
+        with self._lock:
+            if chat_session_id in self._pending:
+                return
+            self._pending.add(chat_session_id)
+        self._executor.submit(self._run, chat_session_id, model_name)
+
+    def _run(self, chat_session_id: int, model_name: str):
+        with self._lock:
+            self._pending.discard(chat_session_id)
+        try:
+            # A long backlog (e.g. a session that predates summaries) is folded in a few passes
+            for _ in range(5):
+                if not update_session_summary(chat_session_id, model_name):
+                    break
+        except Exception as e:
+            print(f"--- ERROR: Summary update failed for session {chat_session_id}: {e} ---")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+conversation_summarizer = ConversationSummarizer()
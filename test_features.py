@@ -63,11 +63,75 @@ def test_environment_variables():
     print()
 
 
+def _query_plan(connection, statement) -> str:
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    return "\n".join(row[-1] for row in rows)
+
+
+def test_query_plans():
+    """Test that chat hot-path queries are served by their composite indexes"""
+    print("Testing query plans...")
+
+    from datetime import datetime, UTC
+    from sqlmodel import SQLModel, create_engine
+    from models import ChatMessage
+    from history_service import history_page_statement, message_page_statement, session_page_statement
+
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+
+    checks = [
+        (
+            "history page",
+            history_page_statement(1, 20),
+            "ix_chat_messages_session_id_created_at_id",
+        ),
+        (
+            "history keyset page",
+            history_page_statement(1, 20, cursor=(datetime.now(UTC), 100), after_message_id=10),
+            "ix_chat_messages_session_id_created_at_id",
+        ),
+        (
+            "history endpoint page",
+            message_page_statement(
+                1, 51, before=(datetime.now(UTC), 100),
+                columns=(ChatMessage.id, ChatMessage.content, ChatMessage.role)
+            ),
+            "ix_chat_messages_session_id_created_at_id",
+        ),
+        (
+            "history endpoint forward page",
+            message_page_statement(1, 51, after=(datetime.now(UTC), 100), columns=(ChatMessage.id,)),
+            "ix_chat_messages_session_id_created_at_id",
+        ),
+        (
+            "session list",
+            session_page_statement(1, 31),
+            "ix_chat_sessions_user_id_last_activity_at_id",
+        ),
+        (
+            "session list keyset page",
+            session_page_statement(1, 31, cursor=(datetime.now(UTC), 100)),
+            "ix_chat_sessions_user_id_last_activity_at_id",
+        ),
+    ]
+
+    with engine.connect() as connection:
+        for name, statement, index_name in checks:
+            plan = _query_plan(connection, statement)
+            assert index_name in plan, f"{name} does not use {index_name}:\n{plan}"
+            print(f"✅ {name}: {plan.splitlines()[0]}")
+
+    print()
+
+
 if __name__ == "__main__":
     print("🔧 Chatbot Configuration Test\n")
     
     test_environment_variables()
     test_models()
     test_web_search()
+    test_query_plans()
     
     print("✨ Test completed!")
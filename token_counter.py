@@ -0,0 +1,126 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+from config import settings
+
+# Closest public BPE for each provider's models. Gemini's tokenizer is not
+# distributed, so its counts are a close estimate rather than exact.
+PROVIDER_ENCODINGS = {
+    "openrouter": "o200k_base",
+    "groq": "cl100k_base",
+    "google": "cl100k_base",
+}
+DEFAULT_ENCODING = "cl100k_base"
+
+# Chat formats add a few framing tokens per message
+TOKENS_PER_MESSAGE = 4
+
+_encodings: Dict[str, Any] = {}
+_encodings_lock = threading.Lock()
+
+
+def _load_encoding(name: str):
+    """Returns the named tokenizer, loading it on first use; None if it can't be loaded."""
+    # Called for every streamed token: only take the lock when the encoding isn't loaded yet
+    if name in _encodings:
+        return _encodings[name]
+    with _encodings_lock:
+        if name not in _encodings:
+            try:
+                if settings.tiktoken_cache_dir:
+                    # Lets deployments ship the BPE files instead of downloading them at runtime
+                    os.environ.setdefault("TIKTOKEN_CACHE_DIR", settings.tiktoken_cache_dir)
+                import tiktoken
+                _encodings[name] = tiktoken.get_encoding(name)
+            except Exception as e:
+                # Missing package or no network to fetch the BPE file; fall back to estimates
+                print(
+                    f"--- ERROR: Tokenizer {name} unavailable, token counts will be ~4 chars/token estimates. "
+                    f"Point tiktoken_cache_dir at a directory with the encoding files to fix this: {e} ---"
+                )
+                _encodings[name] = None
+        return _encodings[name]
+
+
+def _get_encoding(provider: Optional[str]):
+    return _load_encoding(PROVIDER_ENCODINGS.get(provider, DEFAULT_ENCODING))
+
+
+def preload_encodings():
+    """Loads every tokenizer at startup so a missing one is reported before the first chat."""
+    for name in set(PROVIDER_ENCODINGS.values()) | {DEFAULT_ENCODING}:
+        _load_encoding(name)
+
+
+def count_tokens(text: str, provider: Optional[str] = None) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding(provider)
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: List[BaseMessage], provider: Optional[str] = None) -> int:
+    total = 0
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        total += count_tokens(content, provider) + TOKENS_PER_MESSAGE
+    return total
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """
+    Counts prompt and completion tokens for one generation.
+
+    The prompt is counted once from the messages sent to the model and the
+    completion incrementally as tokens stream in. If the provider reports usage
+    at the end of the stream, its numbers replace the local counts.
+    """
+
+    # Counting a token is cheap; without this, async streams hand every token to a thread pool
+    run_inline = True
+
+    def __init__(self, provider: Optional[str] = None):
+        self.provider = provider
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        # "tokenizer", "estimate" when the tokenizer couldn't be loaded, or "provider"
+        self.source = "tokenizer" if _get_encoding(provider) is not None else "estimate"
+        self._completion_chars = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], **kwargs: Any):
+        self.prompt_tokens += sum(count_message_tokens(batch, self.provider) for batch in messages)
+
+    def on_llm_new_token(self, token: str, **kwargs: Any):
+        if _get_encoding(self.provider) is None:
+            # Estimate from the running character count so small chunks don't each round up
+            self._completion_chars += len(token)
+            self.completion_tokens = (self._completion_chars + 3) // 4
+        else:
+            self.completion_tokens += count_tokens(token, self.provider)
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage and usage.get("output_tokens"):
+                    self.prompt_tokens = usage.get("input_tokens", self.prompt_tokens)
+                    self.completion_tokens = usage["output_tokens"]
+                    self.source = "provider"
+                    return
+
+        if not self.completion_tokens:
+            # The model didn't stream tokens; count the finished text instead
+            self.completion_tokens = sum(
+                count_tokens(generation.text, self.provider)
+                for generations in response.generations
+                for generation in generations
+            )
@@ -0,0 +1,284 @@
+import threading
+from collections import Counter
+from datetime import date, datetime, UTC
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlmodel import Session, select
+from database import write_engine
+from models import UsageStats, UsageModelDaily, UserUsageTotals
+from config import settings
+
+COUNTER_FIELDS = (
+    "messages_sent",
+    "tokens_used",
+    "prompt_tokens",
+    "completion_tokens",
+    "sessions_created",
+    "web_searches_made",
+)
+
+# Daily counter -> lifetime total column in user_usage_totals
+TOTAL_FIELDS = {
+    "messages_sent": "total_messages",
+    "tokens_used": "total_tokens",
+    "prompt_tokens": "total_prompt_tokens",
+    "completion_tokens": "total_completion_tokens",
+    "sessions_created": "total_sessions",
+    "web_searches_made": "total_searches",
+}
+
+# INSERT ... ON CONFLICT DO UPDATE is dialect-specific in SQLAlchemy
+UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def _insert_for(dialect_name: str):
+    try:
+        return UPSERT_INSERTS[dialect_name]
+    except KeyError:
+        raise RuntimeError(f"Usage flushes need ON CONFLICT upserts, which '{dialect_name}' is not set up for")
+
+
+class _DailyCounters:
+    def __init__(self):
+        self.counts = Counter()
+        self.model_messages = Counter()
+        self.model_tokens = Counter()
+
+    def merge(self, other: "_DailyCounters"):
+        self.counts.update(other.counts)
+        self.model_messages.update(other.model_messages)
+        self.model_tokens.update(other.model_tokens)
+
+
+class UsageAggregator:
+    """
+    Write-behind buffer for usage statistics.
+
+    Chat turns only bump in-memory counters keyed by (user, UTC day). A
+    background thread flushes them every few seconds as atomic upsert
+    increments, so the request path never waits on a usage write and
+    concurrent workers can't lose each other's updates.
+    """
+
+    def __init__(self, flush_interval: float = 5.0, max_pending: int = 1000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[Tuple[int, date], _DailyCounters] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _counters(self, user_id: int) -> _DailyCounters:
+        # Caller must hold self._lock
+        key = (user_id, datetime.now(UTC).date())
+        counters = self._pending.get(key)
+        if counters is None:
+            counters = self._pending[key] = _DailyCounters()
+            if len(self._pending) >= self.max_pending:
+                self._wake.set()
+        return counters
+
+    def record_message(
+        self,
+        user_id: int,
+        model_name: Optional[str] = None,
+        web_search_used: bool = False,
+        tokens_used: int = 0,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0
+    ):
+        with self._lock:
+            counters = self._counters(user_id)
+            tokens_used = tokens_used or (prompt_tokens + completion_tokens)
+            counters.counts["messages_sent"] += 1
+            counters.counts["tokens_used"] += tokens_used
+            counters.counts["prompt_tokens"] += prompt_tokens
+            counters.counts["completion_tokens"] += completion_tokens
+            if web_search_used:
+                counters.counts["web_searches_made"] += 1
+            if model_name:
+                counters.model_messages[model_name] += 1
+                counters.model_tokens[model_name] += tokens_used
+
+    def record_session_created(self, user_id: int):
+        with self._lock:
+            self._counters(user_id).counts["sessions_created"] += 1
+
+    def flush(self) -> int:
+        """Writes all pending counters to the database. Returns the number of rows touched."""
+        with self._flush_lock:
+            return self._flush_pending()
+
+    def _flush_pending(self) -> int:
+        # Caller must hold self._flush_lock
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+
+        insert = _insert_for(write_engine.dialect.name)
+        written = 0
+        retry: Dict[Tuple[int, date], _DailyCounters] = {}
+        for (user_id, day), counters in batch.items():
+            # One transaction per key, so a row the database rejects can't hold back the others
+            try:
+                with Session(write_engine) as session:
+                    self._upsert(session, insert, user_id, day, counters)
+                    session.commit()
+                written += 1
+            except (IntegrityError, DataError) as e:
+                # Retrying can't fix these (e.g. the user was deleted), so the counts are dropped
+                print(f"--- ERROR: Dropping usage counts for user {user_id} on {day}, rejected by the database: {e} ---")
+            except Exception as e:
+                # Keep the counts for the next attempt instead of dropping them
+                print(f"--- ERROR: Usage flush failed for user {user_id} on {day}, will retry: {e} ---")
+                retry[(user_id, day)] = counters
+
+        if retry:
+            with self._lock:
+                for key, counters in retry.items():
+                    self._pending.setdefault(key, _DailyCounters()).merge(counters)
+        return written
+
+    def _upsert(self, session: Session, insert, user_id: int, day: date, counters: _DailyCounters):
+        now = datetime.now(UTC)
+        values = {field: counters.counts[field] for field in COUNTER_FIELDS}
+        statement = insert(UsageStats).values(
+            user_id=user_id,
+            day=day,
+            date=now,
+            model_usage="{}",
+            created_at=now,
+            updated_at=now,
+            **values
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["user_id", "day"],
+            set_={
+                **{field: getattr(UsageStats, field) + statement.excluded[field] for field in COUNTER_FIELDS},
+                "updated_at": now,
+            }
+        )
+        session.exec(statement)
+
+        for model_name, messages in counters.model_messages.items():
+            statement = insert(UsageModelDaily).values(
+                user_id=user_id,
+                day=day,
+                model=model_name,
+                messages=messages,
+                tokens=counters.model_tokens[model_name]
+            )
+            statement = statement.on_conflict_do_update(
+                index_elements=["user_id", "day", "model"],
+                set_={
+                    "messages": UsageModelDaily.messages + statement.excluded.messages,
+                    "tokens": UsageModelDaily.tokens + statement.excluded.tokens,
+                }
+            )
+            session.exec(statement)
+
+        # Lifetime totals get the same increments in the same transaction
+        statement = insert(UserUsageTotals).values(
+            user_id=user_id,
+            updated_at=now,
+            **{total: counters.counts[field] for field, total in TOTAL_FIELDS.items()}
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={
+                **{
+                    total: getattr(UserUsageTotals, total) + statement.excluded[total]
+                    for total in TOTAL_FIELDS.values()
+                },
+                "updated_at": now,
+            }
+        )
+        session.exec(statement)
+
+    def repair_totals(self, fix: bool = True) -> List[Dict]:
+        """
+        Recomputes every user's lifetime totals from the daily tables and reports
+        users whose stored totals had drifted. With fix=True the stored rows are
+        rewritten to match.
+        """
+        with self._flush_lock:
+            # Pending counts are not in either table yet; write them first so they can't show up as drift
+            self._flush_pending()
+
+            with Session(write_engine) as session:
+                expected: Dict[int, Dict] = {}
+                rows = session.exec(
+                    select(UsageStats.user_id, *[func.sum(getattr(UsageStats, field)) for field in TOTAL_FIELDS])
+                    .group_by(UsageStats.user_id)
+                ).all()
+                for user_id, *sums in rows:
+                    expected[user_id] = {
+                        total: value or 0 for total, value in zip(TOTAL_FIELDS.values(), sums)
+                    }
+
+                stored = {row.user_id: row for row in session.exec(select(UserUsageTotals)).all()}
+
+                drift = []
+                now = datetime.now(UTC)
+                for user_id in expected.keys() | stored.keys():
+                    want = expected.get(user_id) or {total: 0 for total in TOTAL_FIELDS.values()}
+                    row = stored.get(user_id)
+                    have = {total: getattr(row, total) for total in TOTAL_FIELDS.values()} if row else {}
+
+                    differences = {
+                        total: {"stored": have.get(total, 0), "expected": want[total]}
+                        for total in TOTAL_FIELDS.values()
+                        if have.get(total, 0) != want[total]
+                    }
+                    if not differences and row is not None:
+                        continue
+
+                    drift.append({"user_id": user_id, "missing": row is None, "differences": differences})
+                    if fix:
+                        if row is None:
+                            row = UserUsageTotals(user_id=user_id)
+                        for total in TOTAL_FIELDS.values():
+                            setattr(row, total, want[total])
+                        row.updated_at = now
+                        session.add(row)
+
+                if fix:
+                    session.commit()
+
+        print(f"--- INFO: Usage totals repair found drift for {len(drift)} users (fixed: {fix}) ---")
+        return drift
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="usage-flush", daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        """Stops the background thread and flushes whatever is still pending."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        self.flush()
+
+
+usage_aggregator = UsageAggregator(
+    flush_interval=settings.usage_flush_interval_seconds,
+    max_pending=settings.usage_flush_max_pending,
+)
@@ -1,107 +1,76 @@
-import json
-from datetime import datetime, UTC
+from datetime import datetime, timedelta, UTC
 from sqlmodel import Session, select
-from sqlalchemy import func
+from sqlalchemy import and_, func
 from typing import Dict, List
 from database import engine
-from models import UsageStats, User
+from models import UsageStats, UsageModelDaily, UserUsageTotals, User
+from usage_aggregator import usage_aggregator
 
 
 class UsageTracker:
     @staticmethod
-    def track_message(user_id: int, tokens_used: int = 0, model_name: str = None, web_search_used: bool = False):
-        """Track a message sent by the user"""
-        with Session(engine) as session:
-            today = datetime.now(UTC).date()
-            
-            # Get or create today's usage stats
-            statement = select(UsageStats).where(
-                UsageStats.user_id == user_id,
-                func.date(UsageStats.date) == today
-            )
-            usage_stat = session.exec(statement).first()
-            
-            if not usage_stat:
-                usage_stat = UsageStats(
-                    user_id=user_id,
-                    date=datetime.now(UTC),
-                    messages_sent=0,
-                    tokens_used=0,
-                    sessions_created=0,
-                    web_searches_made=0,
-                    model_usage="{}"
-                )
-                session.add(usage_stat)
-            
-            # Update stats
-            usage_stat.messages_sent += 1
-            usage_stat.tokens_used += tokens_used
-            
-            if web_search_used:
-                usage_stat.web_searches_made += 1
-            
-            # Update model usage
-            model_usage = json.loads(usage_stat.model_usage) if usage_stat.model_usage else {}
-            if model_name:
-                model_usage[model_name] = model_usage.get(model_name, 0) + 1
-                usage_stat.model_usage = json.dumps(model_usage)
-            
-            session.commit()
+    def track_message(
+        user_id: int,
+        tokens_used: int = 0,
+        model_name: str = None,
+        web_search_used: bool = False,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0
+    ):
+        """
+        Track a message sent by the user. When prompt/completion counts are given,
+        tokens_used defaults to their sum. Counts are buffered and written in the background.
+        """
+        usage_aggregator.record_message(
+            user_id,
+            model_name=model_name,
+            web_search_used=web_search_used,
+            tokens_used=tokens_used,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens
+        )
     
     @staticmethod
     def track_session_created(user_id: int):
         """Track a new session creation"""
-        with Session(engine) as session:
-            today = datetime.now(UTC).date()
-            
-            # Get or create today's usage stats
-            statement = select(UsageStats).where(
-                UsageStats.user_id == user_id,
-                func.date(UsageStats.date) == today
-            )
-            usage_stat = session.exec(statement).first()
-            
-            if not usage_stat:
-                usage_stat = UsageStats(
-                    user_id=user_id,
-                    date=datetime.now(UTC),
-                    messages_sent=0,
-                    tokens_used=0,
-                    sessions_created=0,
-                    web_searches_made=0,
-                    model_usage="{}"
-                )
-                session.add(usage_stat)
-            
-            usage_stat.sessions_created += 1
-            session.commit()
+        usage_aggregator.record_session_created(user_id)
     
     @staticmethod
     def get_user_usage_stats(user_id: int, days: int = 30) -> List[Dict]:
         """Get usage statistics for a user over the last N days"""
         with Session(engine) as session:
-            # Calculate the date N days ago
-            from datetime import timedelta
             start_date = datetime.now(UTC).date() - timedelta(days=days)
-            
-            statement = select(UsageStats).where(
-                UsageStats.user_id == user_id,
-                func.date(UsageStats.date) >= start_date
-            ).order_by(UsageStats.date.desc())
-            
-            usage_stats = session.exec(statement).all()
-            
+
+            # One row per (day, model): each day's counters joined to its per-model rows on the
+            # usage_model_daily primary key. Range filter on the raw day column so the (user_id, day) index is used.
+            statement = (
+                select(UsageStats, UsageModelDaily.model, UsageModelDaily.messages)
+                .outerjoin(
+                    UsageModelDaily,
+                    and_(UsageModelDaily.user_id == UsageStats.user_id, UsageModelDaily.day == UsageStats.day)
+                )
+                .where(UsageStats.user_id == user_id, UsageStats.day >= start_date)
+                .order_by(UsageStats.day.desc())
+            )
+
             result = []
-            for stat in usage_stats:
-                model_usage = json.loads(stat.model_usage) if stat.model_usage else {}
-                result.append({
-                    "date": stat.date.strftime("%Y-%m-%d"),
-                    "messages_sent": stat.messages_sent,
-                    "tokens_used": stat.tokens_used,
-                    "sessions_created": stat.sessions_created,
-                    "web_searches_made": stat.web_searches_made,
-                    "model_usage": model_usage
-                })
+            by_day: Dict = {}
+            for stat, model, messages in session.exec(statement).all():
+                day_stats = by_day.get(stat.day)
+                if day_stats is None:
+                    day_stats = by_day[stat.day] = {
+                        "date": stat.day.strftime("%Y-%m-%d"),
+                        "messages_sent": stat.messages_sent,
+                        "tokens_used": stat.tokens_used,
+                        "prompt_tokens": stat.prompt_tokens,
+                        "completion_tokens": stat.completion_tokens,
+                        "sessions_created": stat.sessions_created,
+                        "web_searches_made": stat.web_searches_made,
+                        "model_usage": {}
+                    }
+                    result.append(day_stats)
+                if model is not None:
+                    day_stats["model_usage"][model] = messages
             
             return result
     
@@ -109,30 +78,36 @@ class UsageTracker:
     def get_user_total_stats(user_id: int) -> Dict:
         """Get total usage statistics for a user"""
         with Session(engine) as session:
-            statement = select(
-                func.sum(UsageStats.messages_sent).label("total_messages"),
-                func.sum(UsageStats.tokens_used).label("total_tokens"),
-                func.sum(UsageStats.sessions_created).label("total_sessions"),
-                func.sum(UsageStats.web_searches_made).label("total_searches")
-            ).where(UsageStats.user_id == user_id)
-            
-            result = session.exec(statement).first()
-            
-            # Get aggregated model usage
-            model_statement = select(UsageStats.model_usage).where(UsageStats.user_id == user_id)
-            model_usages = session.exec(model_statement).all()
-            
-            aggregated_models = {}
-            for usage_json in model_usages:
-                if usage_json:
-                    model_data = json.loads(usage_json)
-                    for model, count in model_data.items():
-                        aggregated_models[model] = aggregated_models.get(model, 0) + count
+            # Maintained incrementally by the usage flush; a single primary-key lookup
+            totals = session.get(UserUsageTotals, user_id)
+            # Lifetime per-model counts, summed over the usage_model_daily primary key's user_id prefix
+            model_usage = dict(session.exec(
+                select(UsageModelDaily.model, func.sum(UsageModelDaily.messages))
+                .where(UsageModelDaily.user_id == user_id)
+                .group_by(UsageModelDaily.model)
+            ).all())
+            if not totals:
+                return {
+                    "total_messages": 0,
+                    "total_tokens": 0,
+                    "total_sessions": 0,
+                    "total_searches": 0,
+                    "total_prompt_tokens": 0,
+                    "total_completion_tokens": 0,
+                    "model_usage": model_usage
+                }
             
             return {
-                "total_messages": result[0] or 0,
-                "total_tokens": result[1] or 0,
-                "total_sessions": result[2] or 0,
-                "total_searches": result[3] or 0,
-                "model_usage": aggregated_models
+                "total_messages": totals.total_messages,
+                "total_tokens": totals.total_tokens,
+                "total_sessions": totals.total_sessions,
+                "total_searches": totals.total_searches,
+                "total_prompt_tokens": totals.total_prompt_tokens,
+                "total_completion_tokens": totals.total_completion_tokens,
+                "model_usage": model_usage
             }
+
+    @staticmethod
+    def repair_user_totals(fix: bool = True) -> List[Dict]:
+        """Rebuild lifetime totals from the daily tables and report any drift"""
+        return usage_aggregator.repair_totals(fix=fix)
@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from models import User
+from config import settings
+
+# What request handlers read off the current user; secrets like the password hash stay out of memory
+CACHED_FIELDS = (
+    "id",
+    "username",
+    "email",
+    "full_name",
+    "disabled",
+    "role",
+    "is_verified",
+    "created_at",
+    "updated_at",
+)
+
+
+class AuthUserCache:
+    """
+    Short-lived cache of authenticated users, so a request with a known token
+    skips the user lookup.
+
+    Entries are keyed by (username, token issue time) and expire after a few
+    seconds. Anything that changes a user must call invalidate(); that also
+    bumps the user's version, so a lookup that raced the change can't store
+    the old row afterwards.
+    """
+
+    def __init__(self, ttl_seconds: float = 30.0, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, Dict]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get_version(self, username: str) -> int:
+        with self._lock:
+            return self._versions.get(username, 0)
+
+    def get(self, username: str, issued_at: int) -> Optional[User]:
+        """Returns a fresh, detached User built from the cached fields, or None."""
+        key = (username, issued_at)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            fields = entry[1]
+        # A new instance per request, so handlers can't modify each other's user
+        return User(**fields)
+
+    def put(self, username: str, issued_at: int, version: int, user: User):
+        """Stores a user loaded at `version` (read via get_version() before the lookup)."""
+        fields = {field: getattr(user, field) for field in CACHED_FIELDS}
+        with self._lock:
+            if version != self._versions.get(username, 0):
+                # The user changed while it was being loaded
+                return
+            key = (username, issued_at)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, fields)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        """Drops every cached entry for the user, whatever token it came from."""
+        with self._lock:
+            self._versions[username] = self._versions.get(username, 0) + 1
+            self._stats["invalidations"] += 1
+            for key in [key for key in self._entries if key[0] == username]:
+                del self._entries[key]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+auth_user_cache = AuthUserCache(
+    ttl_seconds=settings.auth_user_cache_ttl_seconds,
+    max_entries=settings.auth_user_cache_max_entries,
+)
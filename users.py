@@ -1,12 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks,status
 from sqlmodel import Session , select
-from database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from database import get_session, get_write_session, get_async_session, get_async_write_session, write_engine, async_write_engine
 from models import User, UserCreate, UserRead,Forgot_password_request,Reset_password_request,VerifyEmailRequest,UserUpdate
-from security import get_password_hash, create_access_token, create_password_reset_token, verify_password, verify_password_reset_token
-from dependencies import get_current_active_user, get_user , get_current_user
+from security import create_access_token, create_password_reset_token, verify_password_reset_token, password_hashing_pool
+from dependencies import get_current_active_user, aget_user , get_current_user, require_admin
+from user_cache import auth_user_cache
 from datetime import datetime, timedelta, UTC
 from email_service import send_email
 import secrets
+from anyio import from_thread
 router = APIRouter(
     prefix="/users",
     tags=["users"],
@@ -25,19 +28,19 @@ def get_user_by_username(session: Session, username: str) -> User | None:
     return session.exec(statement).first()
 
 @router.post("/register",response_model=UserRead)
-async def register_new_user(user_create : UserCreate,background_tasks: BackgroundTasks,session : Session = Depends(get_session)):
-    db_user = get_user(session, user_create.username)
+async def register_new_user(user_create : UserCreate,background_tasks: BackgroundTasks,session : AsyncSession = Depends(get_async_session)):
+    db_user = await aget_user(session, user_create.username)
     if db_user:
         raise HTTPException(status_code=400, detail="User already exists")
 
-    db_user_email = get_user_by_email(session, user_create.email)
+    db_user_email = (await session.exec(select(User).where(User.email == user_create.email))).first()
     if db_user_email:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     otp = "".join([str(secrets.randbelow(10)) for _ in range(6)])
     otp_expires_at = datetime.now(UTC) + timedelta(minutes=15)
 
-    hashed_password = get_password_hash(user_create.password)
+    hashed_password = await password_hashing_pool.hash(user_create.password)
     user_data = user_create.model_dump(exclude={"password"})
     
     db_user = User(
@@ -49,9 +52,11 @@ async def register_new_user(user_create : UserCreate,background_tasks: Backgroun
     background_tasks.add_task(
         write_log,f"User registered:{db_user.username}, Email : {db_user.email} \n"
     )
-    session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    # Checks and hashing happen before the write transaction, so the writer is held only for the insert
+    async with AsyncSession(async_write_engine, expire_on_commit=False) as write_session:
+        write_session.add(db_user)
+        await write_session.commit()
+        await write_session.refresh(db_user)
 
     email_subject = "Verify Your Email Address"
     email_body = f"""
@@ -69,7 +74,7 @@ async def register_new_user(user_create : UserCreate,background_tasks: Backgroun
 @router.post("/verify-email")
 def verify_email(
     request : VerifyEmailRequest,
-    session : Session = Depends(get_session),
+    session : Session = Depends(get_write_session),
 
 ):
     user = get_user_by_email(session, request.email)
@@ -88,6 +93,7 @@ def verify_email(
 
     session.add(user)
     session.commit()
+    auth_user_cache.invalidate(user.username)
 
     return {"message": "Email verified successfully. You can now log in."}
 
@@ -136,11 +142,17 @@ def reset_password(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found.",
         )
-    new_hashed_password = get_password_hash(request.new_password)
-    user.hashed_password = new_hashed_password
-
-    session.add(user)
-    session.commit()
+    # The handler stays sync so its DB work runs in the threadpool; the hash still goes through the bounded pool
+    new_hashed_password = from_thread.run(password_hashing_pool.hash, request.new_password)
+    # Written in its own short transaction so the write lock isn't held while hashing
+    with Session(write_engine) as write_session:
+        db_user = write_session.get(User, user.id)
+        if not db_user:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found.")
+        db_user.hashed_password = new_hashed_password
+        write_session.add(db_user)
+        write_session.commit()
+    auth_user_cache.invalidate(user.username)
 
     return {"message": "Password updated successfully."}
 
@@ -152,20 +164,31 @@ async def read_user_me(current_user:User = Depends(get_current_active_user)):
 async def update_user_me(
         *,
         user_update: UserUpdate,
-        session : Session = Depends(get_session),
+        session : AsyncSession = Depends(get_async_write_session),
         current_user: User = Depends(get_current_active_user)
 ):
+    # current_user may come from the auth cache, which holds only some fields; update the stored row
+    db_user = await session.get(User, current_user.id)
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+
     if user_update.email:
-        existing_user = get_user_by_email(session,user_update.email)
-        if existing_user and existing_user.id != current_user.id:
+        existing_user = (await session.exec(select(User).where(User.email == user_update.email))).first()
+        if existing_user and existing_user.id != db_user.id:
             raise HTTPException(status_code=400, detail="Email already registered")
-        current_user.email = user_update.email
+        db_user.email = user_update.email
 
     if user_update.full_name is not None:
-        current_user.full_name = user_update.full_name
+        db_user.full_name = user_update.full_name
+
+    session.add(db_user)
+    await session.commit()
+    await session.refresh(db_user)
+    auth_user_cache.invalidate(db_user.username)
+    return db_user
 
-    session.add(current_user)
-    session.commit()
-    session.refresh(current_user)
-    return current_user
 
+@router.get("/auth-cache/stats")
+def get_auth_cache_stats(admin_user: User = Depends(require_admin)):
+    """Hit/miss counters for the authenticated-user cache."""
+    return auth_user_cache.get_stats()
@@ -1,5 +1,12 @@
+import asyncio
+import threading
+import time
 import requests
-from typing import List, Dict
+import httpx
+from collections import OrderedDict
+from concurrent.futures import Future
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Optional, Tuple
 from config import settings
 
 
@@ -7,62 +14,187 @@ class TavilySearchService:
     def __init__(self):
         self.api_key = settings.tavily_api_key
         self.base_url = "https://api.tavily.com/search"
-    
-    def search(self, query: str, max_results: int = 5) -> List[Dict]:
+        self.timeout = settings.web_search_timeout
+
+        # Keep-alive connection pools, shared by every search made through this service
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.web_search_pool_size)
+        self.session.mount("https://", adapter)
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+        # TTL + LRU result cache and single-flight maps for in-progress searches
+        self._cache: "OrderedDict[Tuple, Tuple[float, List[Dict]]]" = OrderedDict()
+        self._inflight: Dict[Tuple, Future] = {}
+        self._ainflight: Dict[Tuple, asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    def _build_payload(self, query: str, max_results: int, search_depth: str = "basic") -> Dict:
+        return {
+            "api_key": self.api_key,
+            "query": query,
+            "search_depth": search_depth,
+            "include_answer": True,
+            "include_images": False,
+            "include_raw_content": False,
+            "max_results": max_results
+        }
+
+    def _parse_results(self, data: Dict) -> List[Dict]:
+        # Format the results
+        results = []
+        if "results" in data:
+            for result in data["results"]:
+                results.append({
+                    "title": result.get("title", ""),
+                    "content": result.get("content", ""),
+                    "url": result.get("url", ""),
+                    "score": result.get("score", 0)
+                })
+        return results
+
+    def _cache_key(self, query: str, max_results: int, search_depth: str) -> Tuple:
+        return (" ".join(query.split()).casefold(), max_results, search_depth)
+
+    def _get_cached(self, key: Tuple) -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires_at, results = entry
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return results
+
+    def _put_cached(self, key: Tuple, results: List[Dict]):
+        # Empty results usually mean the upstream call failed; don't pin them for the TTL
+        if not results:
+            return
+        with self._lock:
+            self._cache[key] = (time.monotonic() + settings.web_search_cache_ttl_seconds, results)
+            self._cache.move_to_end(key)
+            while len(self._cache) > settings.web_search_cache_max_entries:
+                self._cache.popitem(last=False)
+
+    def _fetch(self, query: str, max_results: int, search_depth: str) -> List[Dict]:
+        try:
+            payload = self._build_payload(query, max_results, search_depth)
+
+            response = self.session.post(self.base_url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+
+            return self._parse_results(response.json())
+
+        except Exception as e:
+            print(f"Error in web search: {e}")
+            return []
+
+    async def _afetch(self, query: str, max_results: int, search_depth: str) -> List[Dict]:
+        try:
+            payload = self._build_payload(query, max_results, search_depth)
+
+            if self._async_client is None:
+                self._async_client = httpx.AsyncClient(
+                    timeout=self.timeout,
+                    limits=httpx.Limits(max_keepalive_connections=settings.web_search_pool_size)
+                )
+            response = await self._async_client.post(self.base_url, json=payload)
+            response.raise_for_status()
+
+            return self._parse_results(response.json())
+
+        except Exception as e:
+            print(f"Error in web search: {e}")
+            return []
+
+    def search(self, query: str, max_results: int = 5, search_depth: str = "basic") -> List[Dict]:
         """
         Search the web using Tavily API
-        
+
         Args:
             query: The search query
             max_results: Maximum number of results to return
-            
+            search_depth: Tavily search depth ("basic" or "advanced")
+
         Returns:
             List of search results with title, content, and URL
         """
+        key = self._cache_key(query, max_results, search_depth)
+        cached = self._get_cached(key)
+        if cached is not None:
+            return cached
+
+        # Single flight: concurrent identical searches wait for one upstream call
+        with self._lock:
+            future = self._inflight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not is_leader:
+            try:
+                return future.result(timeout=self.timeout * 2)
+            except Exception:
+                return []
+
         try:
-            payload = {
-                "api_key": self.api_key,
-                "query": query,
-                "search_depth": "basic",
-                "include_answer": True,
-                "include_images": False,
-                "include_raw_content": False,
-                "max_results": max_results
-            }
-            
-            response = requests.post(self.base_url, json=payload)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            # Format the results
-            results = []
-            if "results" in data:
-                for result in data["results"]:
-                    results.append({
-                        "title": result.get("title", ""),
-                        "content": result.get("content", ""),
-                        "url": result.get("url", ""),
-                        "score": result.get("score", 0)
-                    })
-            
+            results = self._fetch(query, max_results, search_depth)
+            self._put_cached(key, results)
+            future.set_result(results)
             return results
-            
-        except Exception as e:
-            print(f"Error in web search: {e}")
-            return []
-    
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def asearch(self, query: str, max_results: int = 5, search_depth: str = "basic") -> List[Dict]:
+        """
+        Async variant of search() that does not block the event loop.
+        """
+        key = self._cache_key(query, max_results, search_depth)
+        cached = self._get_cached(key)
+        if cached is not None:
+            return cached
+
+        task = self._ainflight.get(key)
+        if task is None:
+            async def run() -> List[Dict]:
+                results = await self._afetch(query, max_results, search_depth)
+                self._put_cached(key, results)
+                return results
+
+            task = asyncio.ensure_future(run())
+            self._ainflight[key] = task
+            task.add_done_callback(lambda _: self._ainflight.pop(key, None))
+
+        # Shield so one cancelled caller doesn't cancel the search for everyone waiting on it
+        return await asyncio.shield(task)
+
+    async def aclose(self):
+        self.session.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
     def format_search_results(self, results: List[Dict]) -> str:
         """
         Format search results for inclusion in the prompt
         """
         if not results:
             return "No web search results found."
-        
+
         formatted = "**Web Search Results:**\n\n"
         for i, result in enumerate(results, 1):
             formatted += f"**{i}. {result['title']}**\n"
             formatted += f"Source: {result['url']}\n"
             formatted += f"{result['content']}\n\n"
-        
+
         return formatted
+
+
+# Shared instance so connection pools and the result cache live for the whole process
+search_service = TavilySearchService()